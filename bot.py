@@ -4,33 +4,74 @@ import discord
 from discord.ext import commands, tasks
 import os
 import math
+import re
 import asyncio
 import json
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string, make_response
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import threading
+import signal
 import time
 import sys
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import googlemaps
 from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 import sqlite3
 from contextlib import contextmanager
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import queue
 import uuid
 import hashlib
 from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
+from functools import lru_cache, partial
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import pickle
-from collections import defaultdict
+import zlib
+from collections import defaultdict, OrderedDict
 import asyncio
 
 
+try:
+    import orjson
+except ImportError:  # Flask's stdlib json provider is used instead
+    orjson = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson.
+    
+    Falls back to the stdlib encoder for options orjson doesn't support
+    (e.g. the indented output Flask uses in debug mode).
+    """
+    
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME  # Dates via self.default, as in Flask
+        if kwargs.pop('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('separators') == (',', ':'):
+            del kwargs['separators']  # orjson output is always compact
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
 # Enhanced Flask app with rate limiting
 app = Flask(__name__)
+if orjson:
+    app.json = OrjsonProvider(app)
+app.config['COMPRESS_MIN_SIZE'] = 512
+Compress(app)
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["500 per day", "100 per hour"],
@@ -50,6 +91,20 @@ bot.http.rate_limit_delay = 1.0  # Add 1 second delay between requests
 
 # Google Maps client
 gmaps = None
+maps_disabled_until = 0.0  # time.time() before which Maps calls are skipped after the key was rejected
+
+# One HTTP session for all Google Maps traffic so keep-alive connections and
+# TLS sessions to maps.googleapis.com are reused across lookups. The pool is
+# sized to the places worker count so concurrent lookups don't evict sockets.
+# Only connection failures are retried here: googlemaps already retries 5xx
+# and OVER_QUERY_LIMIT responses with its own backoff.
+PLACES_WORKERS = 8
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=PLACES_WORKERS,
+    max_retries=Retry(total=None, connect=2, read=0, status=0, backoff_factor=0.2)
+))
 
 # Enhanced database configuration
 DATABASE_PATH = 'enhanced_location_bot.db'
@@ -59,11 +114,42 @@ CACHE_ENABLED = os.getenv('REDIS_URL') is not None
 FLASK_HOST = '0.0.0.0'
 FLASK_PORT = int(os.getenv('PORT', 8080))
 FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+FLASK_ENV = os.getenv('FLASK_ENV', 'production')
+FLASK_UNIX_SOCKET = os.getenv('FLASK_UNIX_SOCKET')  # Set when a local reverse proxy fronts the app
+
+# Credentials, read once at import so main() can fail fast before starting threads
+DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
+GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+WEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
+
+# Stores are in Massachusetts; show local times with DST handled by zoneinfo
+LOCAL_TIMEZONE = ZoneInfo('America/New_York')
+
+# Search cache bucketing (geohash precision 6 is roughly a 1.2km x 0.6km cell)
+GEOHASH_PRECISION = 6
 
 # Enhanced logging setup
+class CachedTimeFormatter(logging.Formatter):
+    """Formatter that runs strftime once per second instead of once per record"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cached_second = None
+        self._cached_time = ''
+    
+    def formatTime(self, record, datefmt=None):
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_time = time.strftime(self.default_time_format, self.converter(record.created))
+        return self.default_msec_format % (self._cached_time, record.msecs)
+
 def setup_enhanced_logging():
     """Setup comprehensive logging system"""
-    formatter = logging.Formatter(
+    # Only the QueueListener thread formats records, so the cache needs no lock
+    formatter = CachedTimeFormatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(funcName)s:%(lineno)d - %(message)s'
     )
     
@@ -81,23 +167,24 @@ def setup_enhanced_logging():
     console_handler.setFormatter(formatter)
     console_handler.setLevel(logging.INFO)
     
+    # Callers only enqueue records; a listener thread formats and writes them,
+    # so file and console I/O stays off the bot loop and request threads
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    
     # Setup logger
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.addHandler(QueueHandler(log_queue))
     
-    return logger
+    return logger, listener
 
-logger = setup_enhanced_logging()
+logger, log_listener = setup_enhanced_logging()
 
 def safe_print(msg):
     """Enhanced safe printing with logging"""
-    timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-    formatted_msg = f"[BOT] {timestamp} {msg}"
     try:
-        print(formatted_msg)
-        sys.stdout.flush()
         logger.info(msg)
     except Exception as e:
         logger.error(f"Logging error: {e}")
@@ -116,9 +203,10 @@ def handle_error(error, context="Unknown"):
 class EnhancedLocationCache:
     """Cache with fallback to in-memory"""
     
-    def __init__(self, default_ttl=1800):
+    def __init__(self, default_ttl=1800, max_entries=4096):
         self.default_ttl = default_ttl
-        self.memory_cache = {}
+        self.max_entries = max_entries
+        self.memory_cache = OrderedDict()
         self.redis_client = None
         
         if CACHE_ENABLED:
@@ -132,9 +220,9 @@ class EnhancedLocationCache:
                 safe_print(f"⚠️ Redis connection failed, using memory cache: {e}")
     
     def _get_cache_key(self, lat: float, lng: float, radius: int, category: str = None) -> str:
-        rounded_lat = round(lat, 3)
-        rounded_lng = round(lng, 3)
-        base_key = f"stores_v2:{rounded_lat}:{rounded_lng}:{radius}"  # Added v2 to force cache refresh
+        # Bucket by ~1.2km geohash cell so nearby users share one upstream search
+        cell = encode_geohash(lat, lng, GEOHASH_PRECISION)
+        base_key = f"stores_v3:{cell}:{int(radius)}"
         return f"{base_key}:{category}" if category else base_key
     
     def get(self, lat: float, lng: float, radius: int, category: str = None) -> Optional[List[Dict]]:
@@ -151,6 +239,7 @@ class EnhancedLocationCache:
                 if key in self.memory_cache:
                     data, expiry = self.memory_cache[key]
                     if datetime.now() < expiry:
+                        self.memory_cache.move_to_end(key)
                         safe_print(f"📋 Memory cache HIT for {key}")
                         return data
                     else:
@@ -172,6 +261,9 @@ class EnhancedLocationCache:
                 # Fallback to memory cache
                 expiry = datetime.now() + timedelta(seconds=cache_ttl)
                 self.memory_cache[key] = (data, expiry)
+                self.memory_cache.move_to_end(key)
+                while len(self.memory_cache) > self.max_entries:
+                    self.memory_cache.popitem(last=False)
                 safe_print(f"💾 Cached {len(data)} items to memory: {key}")
         except Exception as e:
             handle_error(e, "Cache set operation")
@@ -198,35 +290,36 @@ class DatabasePool:
         self.lock = threading.Lock()
         self._init_pool()
     
+    def _connect(self):
+        """Open a connection with the pool's per-connection PRAGMAs applied"""
+        conn = sqlite3.connect(
+            self.database_path, 
+            check_same_thread=False,
+            timeout=30.0
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA cache_size=-16000')  # 16MB per pooled connection
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')  # 256MB
+        return conn
+    
     def _init_pool(self):
         for _ in range(self.pool_size):
-            conn = sqlite3.connect(
-                self.database_path, 
-                check_same_thread=False,
-                timeout=30.0
-            )
-            conn.row_factory = sqlite3.Row
-            conn.execute('PRAGMA journal_mode=WAL')
-            conn.execute('PRAGMA synchronous=NORMAL')
-            conn.execute('PRAGMA cache_size=10000')
-            self.connections.append(conn)
+            self.connections.append(self._connect())
     
     @contextmanager
     def get_connection(self):
         with self.lock:
-            if self.connections:
-                conn = self.connections.pop()
-            else:
-                conn = sqlite3.connect(
-                    self.database_path,
-                    check_same_thread=False,
-                    timeout=30.0
-                )
-                conn.row_factory = sqlite3.Row
+            conn = self.connections.pop() if self.connections else None
+        if conn is None:
+            conn = self._connect()
         
         try:
             yield conn
-            conn.commit()
+            if conn.in_transaction:  # Reads have nothing to commit
+                conn.commit()
         except Exception as e:
             conn.rollback()
             handle_error(e, "Database operation")
@@ -237,9 +330,28 @@ class DatabasePool:
                     self.connections.append(conn)
                 else:
                     conn.close()
+    
+    def close_all(self):
+        """Close every pooled connection (used at shutdown)"""
+        with self.lock:
+            while self.connections:
+                self.connections.pop().close()
 
 db_pool = DatabasePool(DATABASE_PATH)
 
+# Blocking sqlite3 work from bot commands runs here so the Discord event
+# loop (and its gateway heartbeat) never waits on a query
+db_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='db')
+
+def ping_database() -> None:
+    """Round-trip a trivial query through the pool"""
+    with db_pool.get_connection() as conn:
+        conn.execute('SELECT 1').fetchone()
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database helper on db_executor and await the result"""
+    return await asyncio.get_running_loop().run_in_executor(db_executor, partial(func, *args, **kwargs))
+
 def init_enhanced_database():
     """Initialize enhanced database schema"""
     with db_pool.get_connection() as conn:
@@ -372,6 +484,16 @@ def init_enhanced_database():
         # Create indexes for sessions
         conn.execute('CREATE INDEX IF NOT EXISTS idx_session_channel ON location_sessions(channel_id, is_active)')
         conn.execute('CREATE INDEX IF NOT EXISTS idx_session_participants ON session_participants(session_id, is_active)')
+        
+        # Persistent Places search cache (zlib-compressed JSON results)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS places_cache (
+                key TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                inserted_at INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_places_cache_inserted ON places_cache(inserted_at)')
 
 # Comprehensive store database
 @dataclass
@@ -383,15 +505,18 @@ class StoreConfig:
     priority: int
     search_terms: List[str] = None
 
+# Built once at import; callers only read it
+STORE_DATABASE = (
+    # Primary stores (Priority 1) - Exactly what you want
+    StoreConfig("Target", "Target", "🎯", "Department", 1, ["Target", "Target Store", "Target Corporation", "Target Superstore", "Target retail", "Target department store", "471 Salem St", "Salem St Target", "Medford Target"]),
+    StoreConfig("Walmart", "Walmart", "🏪", "Superstore", 1, ["Walmart", "Walmart Supercenter"]),
+    StoreConfig("BJ's Wholesale Club", "BJs", "🛒", "Wholesale", 1, ["BJ's", "BJs", "BJ's Wholesale"]),
+    StoreConfig("Best Buy", "Best Buy", "🔌", "Electronics", 1, ["Best Buy", "BestBuy"]),
+)
+
 def get_comprehensive_store_database():
     """Focused store database - only Target, Walmart, BJ's, and Best Buy for fast check-ins"""
-    return [
-        # Primary stores (Priority 1) - Exactly what you want
-        StoreConfig("Target", "Target", "🎯", "Department", 1, ["Target", "Target Store", "Target Corporation", "Target Superstore", "Target retail", "Target department store", "471 Salem St", "Salem St Target", "Medford Target"]),
-        StoreConfig("Walmart", "Walmart", "🏪", "Superstore", 1, ["Walmart", "Walmart Supercenter"]),
-        StoreConfig("BJ's Wholesale Club", "BJs", "🛒", "Wholesale", 1, ["BJ's", "BJs", "BJ's Wholesale"]),
-        StoreConfig("Best Buy", "Best Buy", "🔌", "Electronics", 1, ["Best Buy", "BestBuy"]),
-    ]
+    return STORE_DATABASE
 
 def get_quick_stores():
     """Get the 4 primary stores for quick check-ins"""
@@ -402,35 +527,51 @@ def get_quick_stores():
         {"name": "Best Buy", "icon": "🔌", "keywords": ["best buy", "bestbuy", "electronics"]}
     ]
 
+MAPS_KEY_VALIDATION_TTL = 24 * 3600
+# API statuses that mean the key itself is unusable, not just this one request
+MAPS_KEY_FAILURE_STATUSES = ('REQUEST_DENIED', 'OVER_DAILY_LIMIT')
+MAPS_KEY_BACKOFF = 15 * 60
+
+def maps_key_validation_key() -> str:
+    """places_cache key recording that the current API key passed validation"""
+    digest = hashlib.blake2b(GOOGLE_MAPS_API_KEY.encode(), digest_size=16).hexdigest()
+    return f"maps_key_validated:{digest}"
+
 def initialize_google_maps():
     """Enhanced Google Maps initialization"""
     global gmaps
     
-    api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-    if not api_key:
+    if not GOOGLE_MAPS_API_KEY:
         safe_print("⚠️ GOOGLE_MAPS_API_KEY not found - real-time search disabled")
         return False
     
-    # Initialize weather API key
-    global WEATHER_API_KEY
-    WEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
-    
     try:
-        gmaps = googlemaps.Client(key=api_key)
-        
-        # Test the API key with a simple request
+        gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY, requests_session=http_session)
+        
+        # A key that passed the test calls within the last day is trusted on
+        # restart, so deploys don't spend two billed requests re-checking it
+        validated_key = maps_key_validation_key()
+        if read_places_cache(validated_key, MAPS_KEY_VALIDATION_TTL):
+            safe_print("✅ Google Maps API key validated within the last 24h - skipping test calls")
+            return True
+        
+        # Test the API key and the Places API side by side - the two calls are
+        # independent, so startup waits for one round trip instead of two
+        places_future = places_executor.submit(
+            gmaps.places_nearby,
+            location=(42.3601, -71.0589),
+            radius=1000,
+            keyword="store"
+        )
         test_result = gmaps.geocode("Boston, MA", region="us")
         if test_result:
             safe_print("✅ Google Maps API initialized successfully")
             
-            # Test Places API
+            # Test Places API; only a key that passes both is trusted on restart
             try:
-                places_result = gmaps.places_nearby(
-                    location=(42.3601, -71.0589),
-                    radius=1000,
-                    keyword="store"
-                )
+                places_future.result()
                 safe_print("✅ Google Places API verified")
+                write_places_cache(validated_key, True)
                 return True
             except Exception as places_error:
                 safe_print(f"⚠️ Google Places API issue: {places_error}")
@@ -444,9 +585,182 @@ def initialize_google_maps():
         gmaps = None
         return False
 
+def note_maps_api_error(error: Exception) -> None:
+    """Back off from a key Google has denied or cut off.
+
+    Drops the cached validation so the next startup re-tests the key, and
+    pauses Maps calls for MAPS_KEY_BACKOFF so /health and the portal report
+    Maps as unavailable instead of failing every search. The first search
+    after the pause tries the key again, so a reset daily quota recovers
+    without a restart.
+    """
+    global maps_disabled_until
+    if not isinstance(error, googlemaps.exceptions.ApiError):
+        return
+    if error.status not in MAPS_KEY_FAILURE_STATUSES:
+        return
+    delete_places_cache(maps_key_validation_key())
+    if maps_available():
+        safe_print(f"❌ Google Maps API key rejected ({error.status}) - "
+                   f"pausing real-time search for {MAPS_KEY_BACKOFF // 60} minutes")
+    maps_disabled_until = time.time() + MAPS_KEY_BACKOFF
+
+def maps_available() -> bool:
+    """True when a Maps client exists and no key back-off is in effect"""
+    return gmaps is not None and time.time() >= maps_disabled_until
+
+# Places search results persisted in SQLite so repeat searches survive restarts.
+# Keyed per geohash cell like store_cache; 30 days is Google's caching limit.
+PLACES_CACHE_TTL = 30 * 24 * 3600
+# An empty answer may be ZERO_RESULTS or a passing Google hiccup; only trust
+# it briefly so a chain doesn't vanish from a whole cell for a month
+PLACES_EMPTY_CACHE_TTL = 15 * 60
+places_cache_stats = {'hits': 0, 'misses': 0}
+places_cache_stats_lock = threading.Lock()
+
+def places_cache_key(location, radius_meters, keyword: str) -> str:
+    """Build the places_cache key for a nearby search"""
+    cell = encode_geohash(location[0], location[1], GEOHASH_PRECISION)
+    # Places keyword matching ignores case and spacing, so neither should split the cache
+    normalized = ' '.join(keyword.casefold().split())
+    raw = f"{cell}:{int(radius_meters)}:{normalized}"
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+def read_places_cache(key: str, max_age: int) -> Optional[Tuple[object, int]]:
+    """Return (value, inserted_at) for a places_cache row younger than max_age"""
+    try:
+        with db_pool.get_connection() as conn:
+            row = conn.execute(
+                'SELECT payload, inserted_at FROM places_cache WHERE key = ? AND inserted_at > ?',
+                (key, int(time.time()) - max_age)
+            ).fetchone()
+        if row:
+            return json.loads(zlib.decompress(row['payload'])), row['inserted_at']
+    except Exception as e:
+        safe_print(f"⚠️ Places cache read failed: {e}")
+    return None
+
+def delete_places_cache(key: str) -> None:
+    """Remove a places_cache row"""
+    try:
+        with db_pool.get_connection() as conn:
+            conn.execute('DELETE FROM places_cache WHERE key = ?', (key,))
+    except Exception as e:
+        safe_print(f"⚠️ Places cache delete failed: {e}")
+
+def write_places_cache(key: str, value) -> None:
+    """Store a JSON-serializable value in places_cache"""
+    write_places_cache_many([(key, value)])
+
+def write_places_cache_many(items: List[Tuple[str, object]]) -> None:
+    """Store several (key, value) pairs in places_cache in one transaction"""
+    if not items:
+        return
+    try:
+        now = int(time.time())
+        rows = [
+            (key, zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8')), now)
+            for key, value in items
+        ]
+        with db_pool.get_connection() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO places_cache (key, payload, inserted_at) VALUES (?, ?, ?)',
+                rows
+            )
+    except Exception as e:
+        safe_print(f"⚠️ Places cache write failed: {e}")
+
+# Place details cache: place_id -> (details, expiry timestamp)
+PLACE_DETAILS_TTL = 3600  # 1 hour
+PLACE_DETAILS_FIELDS = [
+    'name', 'formatted_address', 'formatted_phone_number', 'rating',
+    'user_ratings_total', 'opening_hours', 'website', 'price_level'
+]
+place_details_cache = {}
+
+# Long-lived workers for Places calls, shared across searches so each request
+# doesn't spin up fresh threads. Only submit Places calls here - never work
+# that itself waits on this pool.
+places_executor = ThreadPoolExecutor(max_workers=PLACES_WORKERS, thread_name_prefix='places')
+
+def get_place_details(place_id: str, pending_writes: Optional[List] = None) -> Dict:
+    """Get Place Details, reusing a recent lookup for the same place_id.
+    
+    Pass pending_writes to collect new lookups for one batched
+    write_places_cache_many() instead of writing each as it arrives.
+    """
+    cached = place_details_cache.get(place_id)
+    if cached and time.time() < cached[1]:
+        return cached[0]
+    
+    # Details fetched before a restart are still good for the rest of their TTL
+    key = f"details:{place_id}"
+    stored = read_places_cache(key, PLACE_DETAILS_TTL)
+    if stored:
+        details, inserted_at = stored
+        place_details_cache[place_id] = (details, inserted_at + PLACE_DETAILS_TTL)
+        return details
+    
+    try:
+        details = gmaps.place(place_id=place_id, fields=PLACE_DETAILS_FIELDS)['result']
+    except googlemaps.exceptions.ApiError as e:
+        note_maps_api_error(e)
+        raise
+    place_details_cache[place_id] = (details, time.time() + PLACE_DETAILS_TTL)
+    if pending_writes is not None:
+        pending_writes.append((key, details))
+    else:
+        write_places_cache(key, details)
+    return details
+
+def clear_expired_place_details() -> None:
+    """Drop expired Place Details entries"""
+    now = time.time()
+    expired = [place_id for place_id, (_, expiry) in list(place_details_cache.items()) if now >= expiry]
+    for place_id in expired:
+        place_details_cache.pop(place_id, None)
+    if expired:
+        safe_print(f"🧹 Cleared {len(expired)} expired place details")
+
+def cached_places_nearby(location, radius_meters, keyword: str) -> List[Dict]:
+    """Nearby search results, served from places_cache when fresh"""
+    key = places_cache_key(location, radius_meters, keyword)
+    cached = read_places_cache(key, PLACES_CACHE_TTL)
+    if cached is not None:
+        results, inserted_at = cached
+        if results or time.time() - inserted_at < PLACES_EMPTY_CACHE_TTL:
+            with places_cache_stats_lock:
+                places_cache_stats['hits'] += 1
+            return results
+    
+    with places_cache_stats_lock:
+        places_cache_stats['misses'] += 1
+    
+    try:
+        places_result = gmaps.places_nearby(
+            location=location,
+            radius=radius_meters,
+            keyword=keyword,
+            type='establishment'
+        )
+    except googlemaps.exceptions.ApiError as e:
+        note_maps_api_error(e)
+        raise
+    results = places_result.get('results', [])
+    write_places_cache(key, results)
+    return results
+
+def get_places_cache_hit_rate() -> Optional[float]:
+    """Share of nearby searches answered from places_cache since startup"""
+    with places_cache_stats_lock:
+        total = places_cache_stats['hits'] + places_cache_stats['misses']
+        if not total:
+            return None
+        return round(places_cache_stats['hits'] / total, 3)
+
 def search_stores_parallel(store_configs, location, radius_meters, max_stores_per_type):
     """Search for stores using parallel processing with ThreadPoolExecutor"""
-    if not gmaps:
+    if not maps_available():
         return []
     
     def search_single_store(store_config):
@@ -455,106 +769,117 @@ def search_stores_parallel(store_configs, location, radius_meters, max_stores_pe
             search_terms = store_config.search_terms or [store_config.query]
             found_places = []
             
+            # Later terms are fallbacks for an empty result only. An API error
+            # (quota, denied key, timeout) would fail the same way for every
+            # term, so stop instead of spending a call on each remaining one.
             for search_term in search_terms:
                 try:
-                    places_result = gmaps.places_nearby(
-                        location=location,
-                        radius=radius_meters,
-                        keyword=search_term,
-                        type='establishment'
-                    )
-                    found_places = places_result.get('results', [])
+                    found_places = cached_places_nearby(location, radius_meters, search_term)
                     if found_places:
                         break
                 except Exception as e:
                     safe_print(f"❌ Search term '{search_term}' failed: {e}")
-                    continue
+                    break
             
             return store_config, found_places[:max_stores_per_type]
         except Exception as e:
             safe_print(f"❌ Store search failed for {store_config.chain}: {e}")
             return store_config, []
     
-    # Use ThreadPoolExecutor for parallel processing
-    all_stores = []
+    # Searches and detail lookups both run on the shared places pool
+    max_distance_miles = radius_meters / 1609.34
+    candidates = []
     
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        # Submit all store searches
-        future_to_config = {
-            executor.submit(search_single_store, config): config 
-            for config in store_configs
-        }
-        
-        # Process results as they complete
-        for future in as_completed(future_to_config):
-            try:
-                store_config, places = future.result()
-                if places:
-                    safe_print(f"🔍 {store_config.chain}: found {len(places)} places")
-                else:
-                    continue
+    # Submit all store searches
+    future_to_config = {
+        places_executor.submit(search_single_store, config): config 
+        for config in store_configs
+    }
+    
+    # Collect places within range as the searches complete
+    for future in as_completed(future_to_config):
+        try:
+            store_config, places = future.result()
+            if places:
+                safe_print(f"🔍 {store_config.chain}: found {len(places)} places")
+            else:
+                continue
+            
+            for place in places:
+                try:
+                    place_lat = place['geometry']['location']['lat']
+                    place_lng = place['geometry']['location']['lng']
+                    distance = calculate_distance(location[0], location[1], place_lat, place_lng)
                     
-                # Process places for this store type
-                for place in places:
-                    try:
-                        place_lat = place['geometry']['location']['lat']
-                        place_lng = place['geometry']['location']['lng']
-                        distance = calculate_distance(location[0], location[1], place_lat, place_lng)
-                        
-                        # Skip if too far
-                        max_distance_miles = radius_meters / 1609.34
-                        if distance > max_distance_miles:
-                            continue
-                        
-                        # Get place details with better address handling
-                        place_details = {}
-                        try:
-                            place_details = gmaps.place(
-                                place_id=place['place_id'],
-                                fields=['name', 'formatted_address', 'formatted_phone_number', 'rating', 'user_ratings_total', 'opening_hours', 'website', 'price_level']
-                            )['result']
-                        except Exception as e:
-                            safe_print(f"⚠️ Could not get details for {place.get('name', 'Unknown')}: {e}")
-                            # Use basic place data as fallback
-                            place_details = {
-                                'name': place.get('name'),
-                                'formatted_address': place.get('vicinity', 'Address not available')
-                            }
-                        
-                        # Construct address (reduced logging)
-                        constructed_address = construct_address_from_place(place, place_details)
-                        safe_print(f"📍 {place.get('name', 'Unknown')}: {constructed_address}")
-                        
-                        store_data = {
-                            'name': place.get('name', store_config.chain),
-                            'address': constructed_address,
-                            'lat': place_lat,
-                            'lng': place_lng,
-                            'distance': distance,
-                            'chain': store_config.chain,
-                            'category': store_config.category,
-                            'icon': store_config.icon,
-                            'priority': store_config.priority,
-                            'place_id': place['place_id'],
-                            'phone': place_details.get('formatted_phone_number'),
-                            'rating': place_details.get('rating'),
-                            'rating_count': place_details.get('user_ratings_total'),
-                            'website': place_details.get('website'),
-                            'price_level': place_details.get('price_level'),
-                            'is_open': place_details.get('opening_hours', {}).get('open_now', False),
-                            'quality_score': calculate_quality_score(place_details, distance),
-                            'verified': 'google_places'
-                        }
-                        
-                        all_stores.append(store_data)
-                        
-                    except Exception as e:
-                        safe_print(f"❌ Error processing place: {e}")
+                    # Skip if too far
+                    if distance > max_distance_miles:
                         continue
-                        
-            except Exception as e:
-                safe_print(f"❌ Parallel search error: {e}")
-                continue
+                    
+                    candidates.append((store_config, place, place_lat, place_lng, distance))
+                except Exception as e:
+                    safe_print(f"❌ Error processing place: {e}")
+                    continue
+                    
+        except Exception as e:
+            safe_print(f"❌ Parallel search error: {e}")
+            continue
+    
+    # Fetch details once per unique place, in parallel
+    place_ids = {candidate[1]['place_id'] for candidate in candidates}
+    details_by_id = {}
+    new_details = []  # Fresh API lookups, persisted together below
+    future_to_place_id = {
+        places_executor.submit(get_place_details, place_id, new_details): place_id
+        for place_id in place_ids
+    }
+    for future in as_completed(future_to_place_id):
+        place_id = future_to_place_id[future]
+        try:
+            details_by_id[place_id] = future.result()
+        except Exception as e:
+            # Per-place failure: fall back to basic place data below
+            safe_print(f"⚠️ Could not get details for {place_id}: {e}")
+    write_places_cache_many(new_details)
+    
+    all_stores = []
+    for store_config, place, place_lat, place_lng, distance in candidates:
+        try:
+            # Use basic place data when details are unavailable
+            place_details = details_by_id.get(place['place_id']) or {
+                'name': place.get('name'),
+                'formatted_address': place.get('vicinity', 'Address not available')
+            }
+            
+            # Construct address (reduced logging)
+            constructed_address = construct_address_from_place(place, place_details)
+            safe_print(f"📍 {place.get('name', 'Unknown')}: {constructed_address}")
+            
+            store_data = {
+                'name': place.get('name', store_config.chain),
+                'address': constructed_address,
+                'lat': place_lat,
+                'lng': place_lng,
+                'distance': distance,
+                'chain': store_config.chain,
+                'category': store_config.category,
+                'icon': store_config.icon,
+                'priority': store_config.priority,
+                'place_id': place['place_id'],
+                'phone': place_details.get('formatted_phone_number'),
+                'rating': place_details.get('rating'),
+                'rating_count': place_details.get('user_ratings_total'),
+                'website': place_details.get('website'),
+                'price_level': place_details.get('price_level'),
+                'is_open': place_details.get('opening_hours', {}).get('open_now', False),
+                'quality_score': calculate_quality_score(place_details, distance),
+                'verified': 'google_places'
+            }
+            
+            all_stores.append(store_data)
+            
+        except Exception as e:
+            safe_print(f"❌ Error processing place: {e}")
+            continue
     
     return all_stores
 
@@ -563,43 +888,20 @@ def search_nearby_stores_enhanced(lat: float, lng: float, radius_meters: int = 1
                                  category: str = None, max_stores_per_type: int = 3) -> List[Dict]:
     """Enhanced store search with parallel processing and caching"""
     
-    # Special case: Add Medford Target if user is in Medford area
-    medford_target = None
-    if 42.40 <= lat <= 42.45 and -71.15 <= lng <= -71.05:
-        safe_print(f"🎯 User is in Medford area! Adding Medford Target")
-        # Calculate real distance from user's location
-        medford_target_lat = 42.4184
-        medford_target_lng = -71.1062
-        real_distance = calculate_distance(lat, lng, medford_target_lat, medford_target_lng)
-        safe_print(f"🎯 Calculated distance to Medford Target: {real_distance:.2f} miles")
-        
-        medford_target = {
-            "name": "Target",
-            "address": "471 Salem St, Medford, MA 02155, USA",
-            "lat": medford_target_lat,
-            "lng": medford_target_lng,
-            "distance": real_distance,
-            "chain": "Target",
-            "category": "Department",
-            "icon": "🎯",
-            "phone": "(781) 658-3365",
-            "rating": 4.5,
-            "user_ratings_total": 100,
-            "place_id": "medford_target_manual",
-            "quality_score": 0.9
-        }
-    
-    # Check cache first
+    # Check cache first - entries are shared per geohash cell, so re-rank for this caller
     cached_result = store_cache.get(lat, lng, radius_meters, category)
     if cached_result:
-        return cached_result
+        stores = rerank_stores_for_location(cached_result, lat, lng, radius_meters)
+        return add_medford_target(stores, lat, lng, radius_meters)
     
-    if not gmaps:
+    if not maps_available():
         safe_print("❌ Google Maps API not available")
         return []
     
     try:
-        location = (lat, lng)
+        # The result is shared by everyone in this geohash cell, so search from
+        # the cell centre far enough out to cover any caller's radius within it
+        location, search_radius = cell_search_area(lat, lng, radius_meters)
         store_configs = get_comprehensive_store_database()
         
         # Filter by category if specified
@@ -607,18 +909,7 @@ def search_nearby_stores_enhanced(lat: float, lng: float, radius_meters: int = 1
             store_configs = [s for s in store_configs if s.category.lower() == category.lower()]
         
         # Use parallel processing for store searches
-        all_stores = search_stores_parallel(store_configs, location, radius_meters, max_stores_per_type)
-        
-        # Add Medford Target if applicable
-        if medford_target and medford_target['distance'] <= radius_meters / 1609.34:
-            medford_already_exists = any(
-                store.get('place_id') == 'medford_target_manual' or 
-                (store.get('name') == 'Target' and 'Medford' in store.get('address', ''))
-                for store in all_stores
-            )
-            if not medford_already_exists:
-                all_stores.append(medford_target)
-                safe_print(f"🎯 Added Medford Target manually (distance: {medford_target['distance']:.2f} miles)")
+        all_stores = search_stores_parallel(store_configs, location, search_radius, max_stores_per_type)
         
         # If no stores found, add some fallback stores for testing
         if not all_stores:
@@ -698,7 +989,7 @@ def search_nearby_stores_enhanced(lat: float, lng: float, radius_meters: int = 1
         
         # Remove duplicates and sort
         unique_stores = remove_duplicate_stores(all_stores)
-        unique_stores.sort(key=lambda x: (x.get('priority', 999), x['distance'], -x.get('quality_score', 0)))
+        unique_stores.sort(key=store_sort_key)
         
         safe_print(f"✅ Found {len(unique_stores)} unique stores (from {len(all_stores)} total)")
         
@@ -706,12 +997,85 @@ def search_nearby_stores_enhanced(lat: float, lng: float, radius_meters: int = 1
         cache_ttl = 300 if len(unique_stores) > 0 else 60
         store_cache.set(lat, lng, radius_meters, unique_stores, category, cache_ttl)
         
-        return unique_stores
+        # Per-caller work happens after caching, exactly as on a cache hit
+        stores = rerank_stores_for_location(unique_stores, lat, lng, radius_meters)
+        return add_medford_target(stores, lat, lng, radius_meters)
         
     except Exception as e:
         handle_error(e, "Enhanced store search")
         return []
 
+def store_sort_key(store: Dict) -> tuple:
+    """Sort stores by priority, then distance, then quality"""
+    return (store.get('priority', 999), store['distance'], -store.get('quality_score', 0))
+
+MEDFORD_TARGET_LAT = 42.4184
+MEDFORD_TARGET_LNG = -71.1062
+
+def add_medford_target(stores: List[Dict], lat: float, lng: float, radius_meters: float) -> List[Dict]:
+    """Add the hand-entered Medford Target for callers in the Medford area.
+    
+    Depends on the caller's own position, so it runs after the shared
+    per-cell result has been re-ranked for them, on cache hits and misses alike.
+    """
+    if not (42.40 <= lat <= 42.45 and -71.15 <= lng <= -71.05):
+        return stores
+    
+    safe_print(f"🎯 User is in Medford area! Adding Medford Target")
+    # Calculate real distance from user's location
+    real_distance = calculate_distance(lat, lng, MEDFORD_TARGET_LAT, MEDFORD_TARGET_LNG)
+    safe_print(f"🎯 Calculated distance to Medford Target: {real_distance:.2f} miles")
+    if real_distance > radius_meters / 1609.34:
+        return stores
+    
+    medford_already_exists = any(
+        store.get('place_id') == 'medford_target_manual' or 
+        (store.get('name') == 'Target' and 'Medford' in store.get('address', ''))
+        for store in stores
+    )
+    if medford_already_exists:
+        return stores
+    
+    medford_target = {
+        "name": "Target",
+        "address": "471 Salem St, Medford, MA 02155, USA",
+        "lat": MEDFORD_TARGET_LAT,
+        "lng": MEDFORD_TARGET_LNG,
+        "distance": real_distance,
+        "chain": "Target",
+        "category": "Department",
+        "icon": "🎯",
+        "phone": "(781) 658-3365",
+        "rating": 4.5,
+        "user_ratings_total": 100,
+        "place_id": "medford_target_manual",
+        "quality_score": 0.9
+    }
+    # A Places Target at the same spot wins, as it did before caching
+    stores = remove_duplicate_stores(stores + [medford_target])
+    stores.sort(key=store_sort_key)
+    safe_print(f"🎯 Added Medford Target manually (distance: {real_distance:.2f} miles)")
+    return stores
+
+def cell_search_area(lat: float, lng: float, radius_meters: float) -> Tuple[Tuple[float, float], float]:
+    """Centre and radius of a search that covers radius_meters from anywhere in the caller's cell"""
+    lat_min, lat_max, lng_min, lng_max = geohash_cell_bounds(encode_geohash(lat, lng, GEOHASH_PRECISION))
+    center = ((lat_min + lat_max) / 2, (lng_min + lng_max) / 2)
+    half_diagonal_meters = calculate_distance(center[0], center[1], lat_max, lng_max) * 1609.34
+    # Nearby Search rejects radii above 50km
+    return center, min(radius_meters + half_diagonal_meters, 50000)
+
+def rerank_stores_for_location(stores: List[Dict], lat: float, lng: float, radius_meters: float) -> List[Dict]:
+    """Recompute distances for a cached result from the caller's exact position"""
+    max_distance_miles = radius_meters / 1609.34
+    distances = distances_from(lat, lng, [(store['lat'], store['lng']) for store in stores])
+    reranked = []
+    for store, distance in zip(stores, distances):
+        if distance <= max_distance_miles:
+            reranked.append(dict(store, distance=distance))
+    reranked.sort(key=store_sort_key)
+    return reranked
+
 def calculate_quality_score(place_details: Dict, distance: float) -> float:
     """Calculate a quality score for ranking stores"""
     score = 0.0
@@ -745,6 +1109,9 @@ def calculate_quality_score(place_details: Dict, distance: float) -> float:
     
     return max(0.0, score)
 
+DUPLICATE_RADIUS_METERS = 100  # Places closer than this are the same store
+DUPLICATE_RADIUS_MILES_SQ = (DUPLICATE_RADIUS_METERS / 1609.34) ** 2
+
 def remove_duplicate_stores(stores: List[Dict]) -> List[Dict]:
     """Remove duplicate stores based on place_id and location proximity"""
     seen_place_ids = set()
@@ -758,32 +1125,41 @@ def remove_duplicate_stores(stores: List[Dict]) -> List[Dict]:
         
         # Check for location duplicates (within 100 meters)
         is_duplicate = False
-        for existing_store in unique_stores:
-            # Handle both 'lat'/'lng' and 'latitude'/'longitude' keys
-            existing_lat = existing_store.get('lat') or existing_store.get('latitude')
-            existing_lng = existing_store.get('lng') or existing_store.get('longitude')
-            current_lat = store.get('lat') or store.get('latitude')
-            current_lng = store.get('lng') or store.get('longitude')
+        # Handle both 'lat'/'lng' and 'latitude'/'longitude' keys
+        current_lat = store.get('lat') or store.get('latitude')
+        current_lng = store.get('lng') or store.get('longitude')
+        
+        if current_lat and current_lng:
+            # Degree box around the store that contains the 100m circle, so most
+            # pairs are rejected without trig (111km is just under 1 degree)
+            max_dlat = DUPLICATE_RADIUS_METERS / 111000.0
+            max_dlng = max_dlat / max(math.cos(math.radians(current_lat)), 0.01)
             
-            if not all([existing_lat, existing_lng, current_lat, current_lng]):
-                continue  # Skip if coordinates are missing
+            for existing_store in unique_stores:
+                existing_lat = existing_store.get('lat') or existing_store.get('latitude')
+                existing_lng = existing_store.get('lng') or existing_store.get('longitude')
                 
-            distance_meters = calculate_distance(
-                current_lat, current_lng, 
-                existing_lat, existing_lng
-            ) * 1609.34  # Convert miles to meters
-            
-            if distance_meters < 100:  # Within 100 meters
-                # Keep the one with better quality score
-                current_quality = store.get('quality_score', 0)
-                existing_quality = existing_store.get('quality_score', 0)
-                if current_quality <= existing_quality:
-                    is_duplicate = True
-                    break
-                else:
-                    # Remove the existing lower-quality store
-                    unique_stores.remove(existing_store)
-                    break
+                if not (existing_lat and existing_lng):
+                    continue  # Skip if coordinates are missing
+                
+                if abs(existing_lat - current_lat) > max_dlat or abs(existing_lng - current_lng) > max_dlng:
+                    continue
+                    
+                # Compare squared miles so the check needs no sqrt
+                if squared_distance_fast(
+                    current_lat, current_lng, 
+                    existing_lat, existing_lng
+                ) < DUPLICATE_RADIUS_MILES_SQ:
+                    # Keep the one with better quality score
+                    current_quality = store.get('quality_score', 0)
+                    existing_quality = existing_store.get('quality_score', 0)
+                    if current_quality <= existing_quality:
+                        is_duplicate = True
+                        break
+                    else:
+                        # Remove the existing lower-quality store
+                        unique_stores.remove(existing_store)
+                        break
         
         if not is_duplicate:
             seen_place_ids.add(place_id)
@@ -793,23 +1169,102 @@ def remove_duplicate_stores(stores: List[Dict]) -> List[Dict]:
 
 def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
     """Calculate distance using Haversine formula (returns miles)"""
-    try:
-        R = 3958.8  # Earth radius in miles
-        lat1_rad = math.radians(lat1)
-        lng1_rad = math.radians(lng1)
+    # Inputs are floats from Places or from parse_coordinates, so no guard here
+    R = 3958.8  # Earth radius in miles
+    lat1_rad = math.radians(lat1)
+    lng1_rad = math.radians(lng1)
+    lat2_rad = math.radians(lat2)
+    lng2_rad = math.radians(lng2)
+    
+    dlat = lat2_rad - lat1_rad
+    dlng = lng2_rad - lng1_rad
+    
+    a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlng/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    
+    return R * c
+
+def parse_coordinates(data: Dict) -> Tuple[float, float]:
+    """Read latitude/longitude from a request payload, rejecting invalid values"""
+    lat = float(data['latitude'])
+    lng = float(data['longitude'])
+    # NaN fails these comparisons too
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        raise ValueError(f"Coordinates out of range: {lat}, {lng}")
+    return lat, lng
+
+def squared_distance_fast(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Equirectangular approximation of calculate_distance, squared (returns miles²)
+
+    Treats the Earth as flat around the pair's mean latitude: one cos and no
+    atan2 or sqrt. Within a few miles the error is far below GPS noise, so use
+    it for proximity checks against a squared threshold, not displayed distances.
+    """
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 3958.8 * 3958.8 * (x * x + y * y)
+
+def distances_from(lat: float, lng: float, points: List[Tuple[float, float]]) -> List[float]:
+    """Haversine distances in miles from one origin to many (lat, lng) points"""
+    R = 3958.8  # Earth radius in miles
+    # Origin-side trig is shared by every point, so compute it once
+    lat1_rad = math.radians(lat)
+    lng1_rad = math.radians(lng)
+    cos_lat1 = math.cos(lat1_rad)
+    
+    distances = []
+    for lat2, lng2 in points:
         lat2_rad = math.radians(lat2)
-        lng2_rad = math.radians(lng2)
-        
         dlat = lat2_rad - lat1_rad
-        dlng = lng2_rad - lng1_rad
-        
-        a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlng/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        
-        return R * c
-    except Exception as e:
-        handle_error(e, "Distance calculation")
-        return 999.0
+        dlng = math.radians(lng2) - lng1_rad
+        
+        a = math.sin(dlat/2)**2 + cos_lat1 * math.cos(lat2_rad) * math.sin(dlng/2)**2
+        distances.append(R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a)))
+    return distances
+
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def encode_geohash(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode coordinates as a geohash string of the given length"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, bounds = (lng, lng_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+def geohash_cell_bounds(cell: str) -> Tuple[float, float, float, float]:
+    """Return (lat_min, lat_max, lng_min, lng_max) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in cell:
+        bits = _GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lng_range if even else lat_range
+            mid = (bounds[0] + bounds[1]) / 2
+            if (bits >> shift) & 1:
+                bounds[0] = mid
+            else:
+                bounds[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
 
 def save_last_location(user_id: str, lat: float, lng: float, accuracy: float = None):
     """Save user's last known location for quick check-ins"""
@@ -931,40 +1386,83 @@ def cleanup_old_sessions():
         safe_print(f"❌ Error in cleanup_old_sessions: {e}")
 
 # Enhanced user management
+ROLE_HIERARCHY = {'user': 0, 'moderator': 1, 'admin': 2, 'superadmin': 3}
+LAST_USED_INTERVAL = 600  # Refresh user_permissions.last_used at most every 10 minutes
+PERMISSION_LAST_USED_MAX = 1024  # Same bound as the get_user_role cache
+permission_last_used = OrderedDict()  # user_id -> time of last last_used write, oldest first
+permission_last_used_lock = threading.Lock()
+
+@lru_cache(maxsize=1024)
+def get_user_role(user_id: str) -> Optional[str]:
+    """Stored role for a user, or None. Cached; set_user_role clears it."""
+    with db_pool.get_connection() as conn:
+        result = conn.execute(
+            'SELECT role FROM user_permissions WHERE user_id = ?',
+            (user_id,)
+        ).fetchone()
+    return result['role'] if result else None
+
+def set_user_role(user_id: str, role: str, server_id: str, granted_by: str) -> None:
+    """Grant a role and drop the cached lookup for it"""
+    with db_pool.get_connection() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO user_permissions 
+            (user_id, role, server_id, granted_by)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, role, server_id, granted_by))
+    get_user_role.cache_clear()
+
+def mark_permission_used(user_id: str, now: float) -> bool:
+    """Record a last_used write for user_id; False if one happened within LAST_USED_INTERVAL.
+    
+    Evicting a user only costs one extra UPDATE, so the map is capped rather than pruned.
+    """
+    with permission_last_used_lock:
+        if now - permission_last_used.get(user_id, 0) < LAST_USED_INTERVAL:
+            return False
+        permission_last_used[user_id] = now
+        permission_last_used.move_to_end(user_id)
+        while len(permission_last_used) > PERMISSION_LAST_USED_MAX:
+            permission_last_used.popitem(last=False)
+        return True
+
 def check_user_permissions(user_id: str, required_role: str = 'user') -> bool:
     """Enhanced permission checking with role hierarchy"""
     try:
-        with db_pool.get_connection() as conn:
-            cursor = conn.execute(
-                'SELECT role, permissions FROM user_permissions WHERE user_id = ?',
-                (str(user_id),)
-            )
-            result = cursor.fetchone()
-            
-            if not result:
-                return required_role == 'user'
-            
-            user_role = result['role']
-            role_hierarchy = {'user': 0, 'moderator': 1, 'admin': 2, 'superadmin': 3}
-            
-            has_permission = role_hierarchy.get(user_role, 0) >= role_hierarchy.get(required_role, 0)
-            
-            # Update last used timestamp
-            if has_permission:
+        user_id = str(user_id)
+        user_role = get_user_role(user_id)
+        
+        if user_role is None:
+            return required_role == 'user'
+        
+        has_permission = ROLE_HIERARCHY.get(user_role, 0) >= ROLE_HIERARCHY.get(required_role, 0)
+        
+        # Update last used timestamp
+        now = time.time()
+        if has_permission and mark_permission_used(user_id, now):
+            with db_pool.get_connection() as conn:
                 conn.execute(
                     'UPDATE user_permissions SET last_used = CURRENT_TIMESTAMP WHERE user_id = ?',
-                    (str(user_id),)
+                    (user_id,)
                 )
-            
-            return has_permission
+        
+        return has_permission
             
     except Exception as e:
         handle_error(e, "Permission check")
         return required_role == 'user'
 
 def log_analytics(user_id: str, action: str, data: Dict = None, 
-                 request_obj = None, guild_id: str = None, session_id: str = None) -> None:
-    """Enhanced analytics logging"""
+                 request_obj = None, guild_id: str = None, session_id: str = None,
+                 ip_address: str = None, user_agent: str = None) -> None:
+    """Enhanced analytics logging.
+    
+    Callers running after the request has finished must pass ip_address and
+    user_agent as plain strings rather than request_obj.
+    """
+    if request_obj is not None:
+        ip_address = ip_address or request_obj.remote_addr
+        user_agent = user_agent or request_obj.headers.get('User-Agent')
     try:
         with db_pool.get_connection() as conn:
             conn.execute('''
@@ -976,8 +1474,8 @@ def log_analytics(user_id: str, action: str, data: Dict = None,
                 str(guild_id) if guild_id else None,
                 action,
                 json.dumps(data) if data else None,
-                request_obj.remote_addr if request_obj else None,
-                request_obj.headers.get('User-Agent') if request_obj else None,
+                ip_address,
+                user_agent,
                 session_id
             ))
     except Exception as e:
@@ -1002,6 +1500,10 @@ class TaskManager:
     
     async def cleanup_old_data(self):
         """Clean up old database records"""
+        await run_db(self._delete_old_records)
+    
+    def _delete_old_records(self):
+        """Blocking half of cleanup_old_data, run on db_executor"""
         try:
             cutoff_date = datetime.now() - timedelta(days=90)
             
@@ -1019,8 +1521,23 @@ class TaskManager:
                     (analytics_cutoff,)
                 )
                 
+                # Clean expired Places search cache
+                now = int(time.time())
+                places_result = conn.execute(
+                    'DELETE FROM places_cache WHERE inserted_at <= ?',
+                    (now - PLACES_CACHE_TTL,)
+                )
+                
+                # Place Details rows are only read for PLACE_DETAILS_TTL
+                details_result = conn.execute(
+                    "DELETE FROM places_cache WHERE key LIKE 'details:%' AND inserted_at <= ?",
+                    (now - PLACE_DETAILS_TTL,)
+                )
+                
                 safe_print(f"🧹 Cleanup: {location_result.rowcount} locations, "
-                          f"{analytics_result.rowcount} analytics")
+                          f"{analytics_result.rowcount} analytics, "
+                          f"{places_result.rowcount} cached searches, "
+                          f"{details_result.rowcount} place details")
                 
         except Exception as e:
             handle_error(e, "Data cleanup")
@@ -1035,38 +1552,51 @@ USER_LOCKS = {}  # Prevent duplicate embeds per user
 USER_ASYNC_LOCKS = {}  # Async locks for better concurrency control
 bot_ready = False
 bot_connected = False
+bot_connected_event = threading.Event()  # Lets main() block until on_ready instead of polling
+startup_complete = False  # on_ready fires again on every reconnect; one-time setup runs once
 
 # Enhanced bot events
 @bot.event
 async def on_ready():
     """Enhanced bot startup"""
-    global bot_ready, bot_connected
+    global bot_ready, bot_connected, startup_complete
     
     safe_print(f"🤖 Discord bot connected: {bot.user}")
     bot_connected = True
+    bot_connected_event.set()
     
     try:
-        # Initialize database
-        safe_print("🗄️ Initializing enhanced database...")
-        init_enhanced_database()
-        
-        # Initialize Google Maps
-        safe_print("🗺️ Initializing Google Maps API...")
-        api_available = initialize_google_maps()
-        
-        # Start background tasks
-        safe_print("⚙️ Starting background tasks...")
-        cleanup_task.start()
-        cache_cleanup_task.start()
-        
-        # Sync slash commands with rate limit handling
-        try:
-            safe_print("🔄 Syncing slash commands...")
-            synced = await bot.tree.sync()
-            safe_print(f"✅ Synced {len(synced)} slash commands")
-        except Exception as sync_error:
-            safe_print(f"⚠️ Slash command sync failed (rate limited?): {sync_error}")
-            # Continue anyway - commands will still work
+        # Reconnects re-fire on_ready; starting the loops twice raises and
+        # re-syncing commands each time burns the sync rate limit
+        if startup_complete:
+            safe_print("🔁 Reconnected - skipping one-time startup")
+        else:
+            # Initialize database
+            safe_print("🗄️ Initializing enhanced database...")
+            await run_db(init_enhanced_database)
+            
+            # Initialize Google Maps
+            safe_print("🗺️ Initializing Google Maps API...")
+            # Blocking HTTP checks; keep them off the gateway loop
+            api_available = await asyncio.get_running_loop().run_in_executor(
+                task_manager.executor, initialize_google_maps
+            )
+            
+            # Start background tasks
+            safe_print("⚙️ Starting background tasks...")
+            cleanup_task.start()
+            cache_cleanup_task.start()
+            
+            # Sync slash commands with rate limit handling
+            try:
+                safe_print("🔄 Syncing slash commands...")
+                synced = await bot.tree.sync()
+                safe_print(f"✅ Synced {len(synced)} slash commands")
+            except Exception as sync_error:
+                safe_print(f"⚠️ Slash command sync failed (rate limited?): {sync_error}")
+                # Continue anyway - commands will still work
+            
+            startup_complete = True
         
         bot_ready = True
         safe_print("✅ Enhanced Location Bot is ready!")
@@ -1090,13 +1620,13 @@ async def on_ready():
 async def on_guild_join(guild):
     """Handle new guild joins"""
     safe_print(f"🆕 Joined new guild: {guild.name} ({guild.id})")
-    log_analytics(None, "guild_join", {"guild_id": guild.id, "guild_name": guild.name})
+    db_executor.submit(log_analytics, None, "guild_join", {"guild_id": guild.id, "guild_name": guild.name})
 
 @bot.event
 async def on_guild_remove(guild):
     """Handle guild removals"""
     safe_print(f"👋 Left guild: {guild.name} ({guild.id})")
-    log_analytics(None, "guild_leave", {"guild_id": guild.id, "guild_name": guild.name})
+    db_executor.submit(log_analytics, None, "guild_leave", {"guild_id": guild.id, "guild_name": guild.name})
 
 # Background tasks
 @tasks.loop(hours=24)
@@ -1108,41 +1638,57 @@ async def cleanup_task():
 async def cache_cleanup_task():
     """Cache cleanup task"""
     store_cache.clear_expired()
+    clear_expired_place_details()
     cleanup_old_sessions()  # Clean up old user sessions
 
+# Chain branding and category fallbacks
+STORE_BRANDING = {
+    "Target": {"emoji": "🎯", "color": 0xCC0000, "description": "Department Store"},
+    "Walmart": {"emoji": "🏪", "color": 0x0071CE, "description": "Superstore"},
+    "Best Buy": {"emoji": "🔌", "color": 0x003F7F, "description": "Electronics Store"},
+    "BJs": {"emoji": "🛒", "color": 0xFF6B35, "description": "Wholesale Club"},
+    "Costco": {"emoji": "🏬", "color": 0x004B87, "description": "Warehouse Club"},
+    "Home Depot": {"emoji": "🔨", "color": 0xFF6600, "description": "Home Improvement"},
+    "Lowes": {"emoji": "🏠", "color": 0x004990, "description": "Home Improvement"},
+    "CVS": {"emoji": "💊", "color": 0xCC0000, "description": "Pharmacy"},
+    "Walgreens": {"emoji": "⚕️", "color": 0x0089CF, "description": "Pharmacy"},
+    "Starbucks": {"emoji": "☕", "color": 0x00704A, "description": "Coffee Shop"},
+    "Dunkin": {"emoji": "🍩", "color": 0xFF6600, "description": "Coffee & Donuts"},
+    "McDonalds": {"emoji": "🍟", "color": 0xFFCC00, "description": "Fast Food"},
+    "Shell": {"emoji": "⛽", "color": 0xFFDE00, "description": "Gas Station"},
+    "Mobil": {"emoji": "⛽", "color": 0xFF0000, "description": "Gas Station"},
+    "BofA": {"emoji": "🏦", "color": 0x012169, "description": "Bank"},
+    "TD Bank": {"emoji": "🏦", "color": 0x00B04F, "description": "Bank"},
+    "Chase": {"emoji": "🏦", "color": 0x005DAA, "description": "Bank"}
+}
+
+CATEGORY_EMOJIS = {
+    "Department": "🏬", "Superstore": "🏪", "Electronics": "🔌",
+    "Wholesale": "🛒", "Hardware": "🔨", "Pharmacy": "💊",
+    "Grocery": "🥬", "Coffee": "☕", "Fast Food": "🍟",
+    "Gas": "⛽", "Banking": "🏦", "Auto": "🚗"
+}
+
+CATEGORY_COLORS = {
+    "Department": 0x7289DA, "Superstore": 0x5865F2, "Electronics": 0x3498DB,
+    "Wholesale": 0x9B59B6, "Hardware": 0xE67E22, "Pharmacy": 0xE74C3C,
+    "Grocery": 0x2ECC71, "Coffee": 0x8B4513, "Fast Food": 0xF39C12,
+    "Gas": 0xF1C40F, "Banking": 0x34495E, "Auto": 0x95A5A6
+}
+
 def get_enhanced_store_branding(chain: str, category: str, quality_score: float = 0) -> dict:
     """Enhanced store branding with quality-based colors"""
     
-    # Base branding map
-    branding_map = {
-        "Target": {"emoji": "🎯", "color": 0xCC0000, "description": "Department Store"},
-        "Walmart": {"emoji": "🏪", "color": 0x0071CE, "description": "Superstore"},
-        "Best Buy": {"emoji": "🔌", "color": 0x003F7F, "description": "Electronics Store"},
-        "BJs": {"emoji": "🛒", "color": 0xFF6B35, "description": "Wholesale Club"},
-        "Costco": {"emoji": "🏬", "color": 0x004B87, "description": "Warehouse Club"},
-        "Home Depot": {"emoji": "🔨", "color": 0xFF6600, "description": "Home Improvement"},
-        "Lowes": {"emoji": "🏠", "color": 0x004990, "description": "Home Improvement"},
-        "CVS": {"emoji": "💊", "color": 0xCC0000, "description": "Pharmacy"},
-        "Walgreens": {"emoji": "⚕️", "color": 0x0089CF, "description": "Pharmacy"},
-        "Starbucks": {"emoji": "☕", "color": 0x00704A, "description": "Coffee Shop"},
-        "Dunkin": {"emoji": "🍩", "color": 0xFF6600, "description": "Coffee & Donuts"},
-        "McDonalds": {"emoji": "🍟", "color": 0xFFCC00, "description": "Fast Food"},
-        "Shell": {"emoji": "⛽", "color": 0xFFDE00, "description": "Gas Station"},
-        "Mobil": {"emoji": "⛽", "color": 0xFF0000, "description": "Gas Station"},
-        "BofA": {"emoji": "🏦", "color": 0x012169, "description": "Bank"},
-        "TD Bank": {"emoji": "🏦", "color": 0x00B04F, "description": "Bank"},
-        "Chase": {"emoji": "🏦", "color": 0x005DAA, "description": "Bank"}
-    }
-    
-    # Default branding
-    default_branding = {
-        "emoji": get_category_emoji(category),
-        "color": get_category_color(category),
-        "description": f"{category} Store" if category else "Store"
-    }
-    
-    # Get base branding
-    branding = branding_map.get(chain, default_branding)
+    # Copy so the quality color below never leaks into the shared table
+    base = STORE_BRANDING.get(chain)
+    if base:
+        branding = dict(base)
+    else:
+        branding = {
+            "emoji": get_category_emoji(category),
+            "color": get_category_color(category),
+            "description": f"{category} Store" if category else "Store"
+        }
     
     # Enhance color based on quality score
     if quality_score >= 8:
@@ -1156,28 +1702,18 @@ def get_enhanced_store_branding(chain: str, category: str, quality_score: float
 
 def get_category_emoji(category: str) -> str:
     """Get emoji for store category"""
-    category_emojis = {
-        "Department": "🏬", "Superstore": "🏪", "Electronics": "🔌",
-        "Wholesale": "🛒", "Hardware": "🔨", "Pharmacy": "💊",
-        "Grocery": "🥬", "Coffee": "☕", "Fast Food": "🍟",
-        "Gas": "⛽", "Banking": "🏦", "Auto": "🚗"
-    }
-    return category_emojis.get(category, "🏢")
+    return CATEGORY_EMOJIS.get(category, "🏢")
 
 def get_category_color(category: str) -> int:
     """Get color for store category"""
-    category_colors = {
-        "Department": 0x7289DA, "Superstore": 0x5865F2, "Electronics": 0x3498DB,
-        "Wholesale": 0x9B59B6, "Hardware": 0xE67E22, "Pharmacy": 0xE74C3C,
-        "Grocery": 0x2ECC71, "Coffee": 0x8B4513, "Fast Food": 0xF39C12,
-        "Gas": 0xF1C40F, "Banking": 0x34495E, "Auto": 0x95A5A6
-    }
-    return category_colors.get(category, 0x7289DA)
+    return CATEGORY_COLORS.get(category, 0x7289DA)
+
+NON_DIGIT_RE = re.compile(r'[^0-9]')
 
 def format_phone_number(phone: str) -> str:
     """Format phone number for better display"""
     # Remove all non-digit characters
-    digits = ''.join(filter(str.isdigit, phone))
+    digits = NON_DIGIT_RE.sub('', phone)
     
     # Format US phone numbers
     if len(digits) == 10:
@@ -1256,6 +1792,18 @@ def construct_address_from_place(place: dict, place_details: dict) -> str:
 
 
 
+# Static /ping feature list, joined once rather than rebuilt per call
+PING_FEATURES = (
+    "🔍 Real-time Google Places search",
+    "💾 Advanced caching system", 
+    "🌤️ Weather integration",
+    "📊 Usage analytics",
+    "👥 Group location sharing",
+    "⭐ Favorite locations",
+    "🎯 Smart store filtering"
+)
+PING_FEATURES_TEXT = "\n".join(PING_FEATURES)
+
 # Enhanced bot commands
 @bot.tree.command(name="ping", description="Check bot status and performance metrics")
 async def ping_command(interaction: discord.Interaction):
@@ -1265,19 +1813,18 @@ async def ping_command(interaction: discord.Interaction):
         
         # Test database
         db_start = time.time()
-        with db_pool.get_connection() as conn:
-            conn.execute('SELECT 1').fetchone()
+        await run_db(ping_database)
         db_time = (time.time() - db_start) * 1000
         
         # Test Google Maps API
-        maps_status = "✅ Active" if gmaps else "❌ Not Available"
+        maps_status = "✅ Active" if maps_available() else "❌ Not Available"
         weather_status = "✅ Active" if WEATHER_API_KEY else "❌ Not Configured"
         cache_status = "✅ Redis" if store_cache.redis_client else "📝 Memory"
         
         embed = discord.Embed(
             title="🏓 Enhanced Location Bot Status",
             description="Real-time location sharing with comprehensive store coverage",
-            color=0x00FF00 if gmaps else 0xFFAA00
+            color=0x00FF00 if maps_available() else 0xFFAA00
         )
         
         # Core systems
@@ -1298,16 +1845,7 @@ async def ping_command(interaction: discord.Interaction):
         embed.add_field(name="🔍 Store Types", value=f"{len(get_comprehensive_store_database())}", inline=True)
         
         # Features
-        features = [
-            "🔍 Real-time Google Places search",
-            "💾 Advanced caching system", 
-            "🌤️ Weather integration",
-            "📊 Usage analytics",
-            "👥 Group location sharing",
-            "⭐ Favorite locations",
-            "🎯 Smart store filtering"
-        ]
-        embed.add_field(name="✨ Features", value="\n".join(features), inline=False)
+        embed.add_field(name="✨ Features", value=PING_FEATURES_TEXT, inline=False)
         
         embed.set_footer(text="Enhanced Location Bot • Powered by Google Places & OpenWeather")
         embed.timestamp = discord.utils.utcnow()
@@ -1317,7 +1855,8 @@ async def ping_command(interaction: discord.Interaction):
         
         await interaction.response.send_message(embed=embed)
         
-        log_analytics(
+        db_executor.submit(
+            log_analytics,
             interaction.user.id, 
             "ping_command", 
             {"response_time": response_time, "db_time": db_time},
@@ -1429,7 +1968,7 @@ async def location_command(interaction: discord.Interaction):
             async def background_setup():
                 try:
                     # Check permissions
-                    if not check_user_permissions(interaction.user.id, 'user'):
+                    if not await run_db(check_user_permissions, interaction.user.id, 'user'):
                         await message.edit(content="❌ You don't have permission to use this command.")
                         return
                     
@@ -1471,7 +2010,8 @@ async def location_command(interaction: discord.Interaction):
                     safe_print(f"🔗 Using Railway URL: {railway_url}")
                     
                     # Log analytics
-                    log_analytics(
+                    db_executor.submit(
+                        log_analytics,
                         interaction.user.id,
                         "location_session_created",
                         {
@@ -1516,7 +2056,7 @@ async def search_command(interaction: discord.Interaction,
     
     try:
         # Check permissions
-        if not check_user_permissions(interaction.user.id, 'user'):
+        if not await run_db(check_user_permissions, interaction.user.id, 'user'):
             try:
                 await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
             except:
@@ -1604,71 +2144,87 @@ async def search_command(interaction: discord.Interaction,
             except:
                 safe_print(f"❌ Could not send error message to user: {error_message}")
 
+FAVORITES_SHOWN = 10  # Embed rows in /favorites list
+
+def fetch_favorites(user_id: str) -> Tuple[List[Dict], int]:
+    """A user's top favorites (most visited first) and their total count"""
+    with db_pool.get_connection() as conn:
+        # Only the columns the embed shows, and only the rows it shows
+        cursor = conn.execute('''
+            SELECT name, address, category, visit_count
+            FROM favorite_locations 
+            WHERE user_id = ? 
+            ORDER BY visit_count DESC, created_at DESC
+            LIMIT ?
+        ''', (user_id, FAVORITES_SHOWN))
+        favorites = [dict(row) for row in cursor.fetchall()]
+        total = conn.execute(
+            'SELECT COUNT(*) FROM favorite_locations WHERE user_id = ?', (user_id,)
+        ).fetchone()[0]
+    return favorites, total
+
+def clear_favorites(user_id: str) -> int:
+    """Delete all of a user's favorites, returning how many were removed"""
+    with db_pool.get_connection() as conn:
+        return conn.execute('DELETE FROM favorite_locations WHERE user_id = ?', (user_id,)).rowcount
+
 @bot.tree.command(name="favorites", description="Manage your favorite locations")
 async def favorites_command(interaction: discord.Interaction, 
                            action: str = "list",
                            name: str = None):
     """Manage favorite locations"""
     try:
-        if not check_user_permissions(interaction.user.id, 'user'):
+        if not await run_db(check_user_permissions, interaction.user.id, 'user'):
             await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
             return
         
         user_id = str(interaction.user.id)
         
-        with db_pool.get_connection() as conn:
-            if action == "list":
-                cursor = conn.execute('''
-                    SELECT name, address, category, visit_count, created_at
-                    FROM favorite_locations 
-                    WHERE user_id = ? 
-                    ORDER BY visit_count DESC, created_at DESC
-                    LIMIT 20
-                ''', (user_id,))
-                
-                favorites = cursor.fetchall()
-                
-                if not favorites:
-                    embed = discord.Embed(
-                        title="⭐ Your Favorite Locations",
-                        description="You haven't saved any favorite locations yet!\nUse the location portal to save places you visit frequently.",
-                        color=0x5865F2
-                    )
-                else:
-                    embed = discord.Embed(
-                        title="⭐ Your Favorite Locations",
-                        description=f"You have {len(favorites)} saved locations:",
-                        color=0x5865F2
-                    )
-                    
-                    for fav in favorites[:10]:  # Show top 10
-                        visit_text = f"Visited {fav['visit_count']} times" if fav['visit_count'] > 0 else "Never visited"
-                        embed.add_field(
-                            name=f"{fav['name']} ({fav['category']})",
-                            value=f"{fav['address']}\n*{visit_text}*",
-                            inline=False
-                        )
-                
-                embed.set_footer(text="Use the location portal to add new favorites")
-                
-            elif action == "clear":
-                result = conn.execute('DELETE FROM favorite_locations WHERE user_id = ?', (user_id,))
+        if action == "list":
+            favorites, total_favorites = await run_db(fetch_favorites, user_id)
+            
+            if not favorites:
                 embed = discord.Embed(
-                    title="🗑️ Favorites Cleared",
-                    description=f"Removed {result.rowcount} favorite locations.",
-                    color=0xFF6B6B
+                    title="⭐ Your Favorite Locations",
+                    description="You haven't saved any favorite locations yet!\nUse the location portal to save places you visit frequently.",
+                    color=0x5865F2
                 )
-                
             else:
                 embed = discord.Embed(
-                    title="❌ Invalid Action",
-                    description="Available actions: `list`, `clear`",
-                    color=0xFF6B6B
+                    title="⭐ Your Favorite Locations",
+                    description=f"You have {total_favorites} saved locations:",
+                    color=0x5865F2
                 )
+                
+                for fav in favorites:  # Top FAVORITES_SHOWN
+                    visit_text = f"Visited {fav['visit_count']} times" if fav['visit_count'] > 0 else "Never visited"
+                    embed.add_field(
+                        name=f"{fav['name']} ({fav['category']})",
+                        value=f"{fav['address']}\n*{visit_text}*",
+                        inline=False
+                    )
+            
+            embed.set_footer(text="Use the location portal to add new favorites")
+            
+        elif action == "clear":
+            removed = await run_db(clear_favorites, user_id)
+            embed = discord.Embed(
+                title="🗑️ Favorites Cleared",
+                description=f"Removed {removed} favorite locations.",
+                color=0xFF6B6B
+            )
+            
+        else:
+            embed = discord.Embed(
+                title="❌ Invalid Action",
+                description="Available actions: `list`, `clear`",
+                color=0xFF6B6B
+            )
         
         await interaction.response.send_message(embed=embed)
         
-        log_analytics(
+        db_executor.submit(
+            log_analytics,
             interaction.user.id,
             f"favorites_{action}",
             {"action": action, "name": name},
@@ -1679,113 +2235,122 @@ async def favorites_command(interaction: discord.Interaction,
         error_id = handle_error(e, "Favorites command")
         await interaction.response.send_message(f"❌ Error managing favorites (ID: {error_id})")
 
+def fetch_personal_stats(user_id: str) -> Dict:
+    """Check-in counts and top category for one user"""
+    with db_pool.get_connection() as conn:
+        # All counts in one statement
+        counts = conn.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM user_locations WHERE user_id = :user_id) AS location_count,
+                (SELECT COUNT(*) FROM favorite_locations WHERE user_id = :user_id) AS favorites_count,
+                (SELECT COUNT(*) FROM user_locations
+                 WHERE user_id = :user_id AND timestamp > datetime('now', '-7 days')) AS recent_activity
+        ''', {'user_id': user_id}).fetchone()
+        
+        # Most visited category
+        top_category = conn.execute('''
+            SELECT store_category, COUNT(*) as visits
+            FROM user_locations 
+            WHERE user_id = ? AND store_category IS NOT NULL
+            GROUP BY store_category
+            ORDER BY visits DESC
+            LIMIT 1
+        ''', (user_id,)).fetchone()
+    
+    return {
+        'location_count': counts['location_count'],
+        'favorites_count': counts['favorites_count'],
+        'recent_activity': counts['recent_activity'],
+        'top_category': dict(top_category) if top_category else None
+    }
+
+def fetch_server_stats(guild_id: Optional[str]) -> Dict:
+    """User/check-in totals and popular categories for one guild"""
+    with db_pool.get_connection() as conn:
+        totals = conn.execute('''
+            SELECT COUNT(DISTINCT user_id) as users, COUNT(*) as locations
+            FROM user_locations 
+            WHERE guild_id = ?
+        ''', (guild_id,)).fetchone()
+        
+        # Popular categories
+        popular_categories = conn.execute('''
+            SELECT store_category, COUNT(*) as visits
+            FROM user_locations 
+            WHERE guild_id = ? AND store_category IS NOT NULL
+            GROUP BY store_category
+            ORDER BY visits DESC
+            LIMIT 5
+        ''', (guild_id,)).fetchall()
+    
+    return {
+        'total_users': totals['users'],
+        'total_locations': totals['locations'],
+        'popular_categories': [dict(row) for row in popular_categories]
+    }
+
 @bot.tree.command(name="stats", description="View location and usage statistics")
 async def stats_command(interaction: discord.Interaction, 
                        scope: str = "personal"):
     """Enhanced statistics command"""
     try:
         user_id = str(interaction.user.id)
-        is_admin = check_user_permissions(user_id, 'admin')
+        is_admin = await run_db(check_user_permissions, user_id, 'admin')
         
         if scope == "server" and not is_admin:
             await interaction.response.send_message("❌ Admin permissions required for server stats.", ephemeral=True)
             return
         
-        with db_pool.get_connection() as conn:
-            if scope == "personal":
-                # Personal statistics
-                location_count = conn.execute(
-                    'SELECT COUNT(*) as count FROM user_locations WHERE user_id = ?',
-                    (user_id,)
-                ).fetchone()['count']
-                
-                favorites_count = conn.execute(
-                    'SELECT COUNT(*) as count FROM favorite_locations WHERE user_id = ?',
-                    (user_id,)
-                ).fetchone()['count']
-                
-                # Most visited category
-                top_category = conn.execute('''
-                    SELECT store_category, COUNT(*) as visits
-                    FROM user_locations 
-                    WHERE user_id = ? AND store_category IS NOT NULL
-                    GROUP BY store_category
-                    ORDER BY visits DESC
-                    LIMIT 1
-                ''', (user_id,)).fetchone()
-                
-                # Recent activity
-                recent_activity = conn.execute('''
-                    SELECT COUNT(*) as count
-                    FROM user_locations 
-                    WHERE user_id = ? AND timestamp > datetime('now', '-7 days')
-                ''', (user_id,)).fetchone()['count']
-                
-                embed = discord.Embed(
-                    title="📊 Your Location Statistics",
-                    description=f"Statistics for {interaction.user.display_name}",
-                    color=0x5865F2
-                )
-                
-                embed.add_field(name="📍 Total Check-ins", value=f"{location_count:,}", inline=True)
-                embed.add_field(name="⭐ Favorite Locations", value=f"{favorites_count:,}", inline=True)
-                embed.add_field(name="📅 This Week", value=f"{recent_activity:,}", inline=True)
-                
-                if top_category:
-                    embed.add_field(
-                        name="🏆 Favorite Category",
-                        value=f"{top_category['store_category']} ({top_category['visits']} visits)",
-                        inline=False
-                    )
-                
-            elif scope == "server" and is_admin:
-                # Server statistics
-                guild_id = str(interaction.guild.id) if interaction.guild else None
-                
-                total_users = conn.execute('''
-                    SELECT COUNT(DISTINCT user_id) as count
-                    FROM user_locations 
-                    WHERE guild_id = ?
-                ''', (guild_id,)).fetchone()['count']
-                
-                total_locations = conn.execute('''
-                    SELECT COUNT(*) as count
-                    FROM user_locations 
-                    WHERE guild_id = ?
-                ''', (guild_id,)).fetchone()['count']
-                
-                # Popular categories
-                popular_categories = conn.execute('''
-                    SELECT store_category, COUNT(*) as visits
-                    FROM user_locations 
-                    WHERE guild_id = ? AND store_category IS NOT NULL
-                    GROUP BY store_category
-                    ORDER BY visits DESC
-                    LIMIT 5
-                ''', (guild_id,)).fetchall()
-                
-                embed = discord.Embed(
-                    title="📊 Server Location Statistics",
-                    description=f"Statistics for {interaction.guild.name}",
-                    color=0x5865F2
+        if scope == "personal":
+            stats = await run_db(fetch_personal_stats, user_id)
+            
+            embed = discord.Embed(
+                title="📊 Your Location Statistics",
+                description=f"Statistics for {interaction.user.display_name}",
+                color=0x5865F2
+            )
+            
+            embed.add_field(name="📍 Total Check-ins", value=f"{stats['location_count']:,}", inline=True)
+            embed.add_field(name="⭐ Favorite Locations", value=f"{stats['favorites_count']:,}", inline=True)
+            embed.add_field(name="📅 This Week", value=f"{stats['recent_activity']:,}", inline=True)
+            
+            top_category = stats['top_category']
+            if top_category:
+                embed.add_field(
+                    name="🏆 Favorite Category",
+                    value=f"{top_category['store_category']} ({top_category['visits']} visits)",
+                    inline=False
                 )
-                
-                embed.add_field(name="👥 Active Users", value=f"{total_users:,}", inline=True)
-                embed.add_field(name="📍 Total Check-ins", value=f"{total_locations:,}", inline=True)
-                
-                if popular_categories:
-                    category_list = "\n".join([
-                        f"{i+1}. {cat['store_category']}: {cat['visits']:,} visits"
-                        for i, cat in enumerate(popular_categories)
-                    ])
-                    embed.add_field(name="🏆 Popular Categories", value=category_list, inline=False)
+            
+        elif scope == "server" and is_admin:
+            # Server statistics
+            guild_id = str(interaction.guild.id) if interaction.guild else None
+            stats = await run_db(fetch_server_stats, guild_id)
+            
+            embed = discord.Embed(
+                title="📊 Server Location Statistics",
+                description=f"Statistics for {interaction.guild.name}",
+                color=0x5865F2
+            )
+            
+            embed.add_field(name="👥 Active Users", value=f"{stats['total_users']:,}", inline=True)
+            embed.add_field(name="📍 Total Check-ins", value=f"{stats['total_locations']:,}", inline=True)
+            
+            popular_categories = stats['popular_categories']
+            if popular_categories:
+                category_list = "\n".join([
+                    f"{i+1}. {cat['store_category']}: {cat['visits']:,} visits"
+                    for i, cat in enumerate(popular_categories)
+                ])
+                embed.add_field(name="🏆 Popular Categories", value=category_list, inline=False)
         
         embed.set_footer(text="Enhanced Location Bot Statistics")
         embed.timestamp = discord.utils.utcnow()
         
         await interaction.response.send_message(embed=embed)
         
-        log_analytics(
+        db_executor.submit(
+            log_analytics,
             interaction.user.id,
             "stats_viewed",
             {"scope": scope},
@@ -1802,7 +2367,7 @@ async def setperm_command(interaction: discord.Interaction,
                          role: str):
     """Enhanced permission management"""
     try:
-        if not check_user_permissions(interaction.user.id, 'admin'):
+        if not await run_db(check_user_permissions, interaction.user.id, 'admin'):
             await interaction.response.send_message("❌ You need admin permissions to use this command.", ephemeral=True)
             return
         
@@ -1811,12 +2376,7 @@ async def setperm_command(interaction: discord.Interaction,
             await interaction.response.send_message(f"❌ Invalid role. Use: {', '.join(valid_roles)}", ephemeral=True)
             return
         
-        with db_pool.get_connection() as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO user_permissions 
-                (user_id, role, server_id, granted_by)
-                VALUES (?, ?, ?, ?)
-            ''', (str(user.id), role, str(interaction.guild.id), str(interaction.user.id)))
+        await run_db(set_user_role, str(user.id), role, str(interaction.guild.id), str(interaction.user.id))
         
         embed = discord.Embed(
             title="✅ Permissions Updated",
@@ -1826,7 +2386,8 @@ async def setperm_command(interaction: discord.Interaction,
         
         await interaction.response.send_message(embed=embed)
         
-        log_analytics(
+        db_executor.submit(
+            log_analytics,
             interaction.user.id,
             "permission_granted",
             {
@@ -1892,12 +2453,12 @@ async def quick_command(interaction: discord.Interaction):
     """Quick check-in using last known location for super-fast check-ins"""
     try:
         # Check permissions
-        if not check_user_permissions(interaction.user.id, 'user'):
+        if not await run_db(check_user_permissions, interaction.user.id, 'user'):
             await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
             return
         
         # Get last known location
-        last_location = get_last_location(str(interaction.user.id))
+        last_location = await run_db(get_last_location, str(interaction.user.id))
         
         if not last_location:
             await interaction.response.send_message(
@@ -1908,15 +2469,23 @@ async def quick_command(interaction: discord.Interaction):
         
         # Check if location is recent (within 24 hours)
         last_updated = datetime.fromisoformat(last_location['last_updated'].replace('Z', '+00:00'))
-        if datetime.now(timezone.utc) - last_updated > timedelta(hours=24):
+        if last_updated.tzinfo is None:
+            # SQLite datetime('now') is UTC without an offset
+            last_updated = last_updated.replace(tzinfo=timezone.utc)
+        now = datetime.now(timezone.utc)
+        if now - last_updated > timedelta(hours=24):
             await interaction.response.send_message(
                 "⚠️ Your last location is over 24 hours old. Please use `/location` to update your location.",
                 ephemeral=True
             )
             return
         
-        # Search for stores near last location
-        stores = search_nearby_stores_enhanced(
+        # Search for stores near last location. The search blocks on the Places
+        # fan-out, so run it off the event loop (task pool, not places_executor,
+        # since it waits on the places pool itself)
+        stores = await asyncio.get_running_loop().run_in_executor(
+            task_manager.executor,
+            search_nearby_stores_enhanced,
             last_location['latitude'], 
             last_location['longitude'], 
             12800,  # 8 miles
@@ -1938,17 +2507,17 @@ async def quick_command(interaction: discord.Interaction):
             color=0x00FF00
         )
         
-        # Show available stores
-        store_list = ""
-        for i, store in enumerate(stores[:4], 1):  # Show top 4 stores
-            distance = store.get('distance', 0)
-            store_list += f"{i}. **{store['name']}** - {distance:.1f} miles\n"
-            store_list += f"   📍 {store.get('address', 'Address not available')}\n\n"
+        # Show available stores (top 4)
+        store_list = "\n\n".join(
+            f"{i}. **{store['name']}** - {store.get('distance', 0):.1f} miles\n"
+            f"   📍 {store.get('address', 'Address not available')}"
+            for i, store in enumerate(stores[:4], 1)
+        )
         
         embed.add_field(name="🏪 Available Stores", value=store_list, inline=False)
         embed.add_field(
             name="📍 Last Location", 
-            value=f"Lat: {last_location['latitude']:.4f}, Lng: {last_location['longitude']:.4f}\nUpdated: {last_updated.strftime('%Y-%m-%d %H:%M')}",
+            value=f"Lat: {last_location['latitude']:.4f}, Lng: {last_location['longitude']:.4f}\nUpdated: {last_updated.astimezone(LOCAL_TIMEZONE):%Y-%m-%d %I:%M %p %Z}",
             inline=False
         )
         
@@ -1964,11 +2533,12 @@ async def quick_command(interaction: discord.Interaction):
         await interaction.response.send_message(embed=embed, ephemeral=False)
         
         # Log analytics
-        log_analytics(
+        db_executor.submit(
+            log_analytics,
             interaction.user.id,
             "quick_checkin_attempted",
             {
-                "last_location_age_hours": (datetime.now(timezone.utc) - last_updated).total_seconds() / 3600,
+                "last_location_age_hours": (now - last_updated).total_seconds() / 3600,
                 "stores_found": len(stores)
             },
             guild_id=interaction.guild.id if interaction.guild else None
@@ -1978,29 +2548,696 @@ async def quick_command(interaction: discord.Interaction):
         error_id = handle_error(e, "Quick command")
         await interaction.response.send_message(f"❌ Error with quick check-in (ID: {error_id})", ephemeral=True)
 
-# Enhanced Flask routes
-@app.route('/', methods=['GET'])
-def enhanced_index():
-    """Serve enhanced location sharing interface"""
-    session_id = request.args.get('session')
-    user_id = request.args.get('user')
-    channel_id = request.args.get('channel')
-    category = request.args.get('category', '')
-    radius = request.args.get('radius', '10')
+# Location portal page and its stylesheet and script, built once at import
+PORTAL_CSS = ''':root {
+    --primary-blue: #4285F4;
+    --primary-green: #34A853;
+    --accent-red: #EA4335;
+    --accent-yellow: #FBBC04;
+    --dark-bg: #1a1a2e;
+    --dark-secondary: #16213e;
+    --glass-bg: rgba(255, 255, 255, 0.1);
+    --glass-border: rgba(255, 255, 255, 0.2);
+}
+
+* { margin: 0; padding: 0; box-sizing: border-box; }
+
+body {
+    font-family: 'Segoe UI', system-ui, -apple-system, sans-serif;
+    background: linear-gradient(135deg, var(--primary-blue) 0%, var(--primary-green) 100%);
+    min-height: 100vh;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    padding: 20px;
+    transition: all 0.3s ease;
+}
+
+body.dark-mode {
+    background: linear-gradient(135deg, var(--dark-bg) 0%, var(--dark-secondary) 100%);
+}
+
+.theme-toggle {
+    position: fixed;
+    top: 20px;
+    right: 20px;
+    background: var(--glass-bg);
+    backdrop-filter: blur(20px);
+    border: 1px solid var(--glass-border);
+    border-radius: 50%;
+    width: 50px;
+    height: 50px;
+    color: white;
+    font-size: 20px;
+    cursor: pointer;
+    display: flex;
+    align-items: center;
+    justify-content: center;
+    transition: all 0.3s ease;
+    z-index: 1000;
+}
+
+.theme-toggle:hover {
+    transform: scale(1.1);
+    background: var(--glass-border);
+}
+
+.container {
+    background: rgba(255, 255, 255, 0.95);
+    backdrop-filter: blur(30px);
+    border-radius: 24px;
+    padding: 40px;
+    max-width: 800px;
+    width: 100%;
+    box-shadow: 0 20px 60px rgba(0, 0, 0, 0.1);
+    text-align: center;
+    transition: all 0.3s ease;
+}
+
+.dark-mode .container {
+    background: rgba(30, 30, 30, 0.95);
+    color: white;
+}
+
+.logo { 
+    font-size: 60px; 
+    margin-bottom: 20px; 
+    animation: pulse 2s infinite;
+}
+
+@keyframes pulse {
+    0%, 100% { transform: scale(1); }
+    50% { transform: scale(1.05); }
+}
+
+h1 { 
+    color: #2d3748; 
+    font-size: 32px; 
+    font-weight: 700; 
+    margin-bottom: 10px;
+    background: linear-gradient(135deg, var(--primary-blue), var(--primary-green));
+    -webkit-background-clip: text;
+    -webkit-text-fill-color: transparent;
+    background-clip: text;
+}
+
+.dark-mode h1 {
+    color: white;
+    -webkit-text-fill-color: white;
+}
+
+.subtitle { 
+    color: #718096; 
+    font-size: 18px; 
+    margin-bottom: 30px; 
+}
+
+.dark-mode .subtitle {
+    color: #a0aec0;
+}
+
+.enhanced-badge {
+    background: linear-gradient(135deg, var(--primary-green), #0F9D58);
+    color: white;
+    padding: 15px 20px;
+    border-radius: 15px;
+    margin-bottom: 30px;
+    font-size: 16px;
+    font-weight: 600;
+    box-shadow: 0 8px 25px rgba(52, 168, 83, 0.3);
+}
+
+.features-grid {
+    display: grid;
+    grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
+    gap: 20px;
+    margin: 30px 0;
+}
+
+.feature-card {
+    background: var(--glass-bg);
+    backdrop-filter: blur(10px);
+    border: 1px solid var(--glass-border);
+    border-radius: 16px;
+    padding: 20px;
+    transition: all 0.3s ease;
+}
+
+.feature-card:hover {
+    transform: translateY(-5px);
+    box-shadow: 0 15px 35px rgba(0, 0, 0, 0.1);
+}
+
+.dark-mode .feature-card {
+    background: rgba(255, 255, 255, 0.05);
+    border-color: rgba(255, 255, 255, 0.1);
+}
+
+.action-buttons {
+    display: flex;
+    gap: 15px;
+    flex-wrap: wrap;
+    justify-content: center;
+    margin: 30px 0;
+}
+
+.btn {
+    background: linear-gradient(135deg, var(--primary-blue) 0%, var(--primary-green) 100%);
+    color: white;
+    border: none;
+    padding: 16px 32px;
+    border-radius: 16px;
+    font-size: 16px;
+    font-weight: 600;
+    cursor: pointer;
+    transition: all 0.3s ease;
+    box-shadow: 0 8px 25px rgba(66, 133, 244, 0.3);
+    text-decoration: none;
+    display: inline-flex;
+    align-items: center;
+    gap: 8px;
+}
+
+.btn:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 12px 35px rgba(66, 133, 244, 0.4);
+}
+
+.btn:disabled {
+    opacity: 0.6;
+    cursor: not-allowed;
+    transform: none;
+}
+
+.btn-secondary {
+    background: linear-gradient(135deg, #6c757d, #495057);
+}
+
+#map { 
+    height: 400px; 
+    width: 100%; 
+    border-radius: 16px; 
+    margin: 25px 0; 
+    display: none;
+    box-shadow: 0 8px 25px rgba(0, 0, 0, 0.1);
+}
+
+.status {
+    margin: 25px 0;
+    padding: 20px;
+    border-radius: 16px;
+    font-weight: 600;
+    display: none;
+    backdrop-filter: blur(10px);
+}
+
+.status.success { 
+    background: linear-gradient(135deg, var(--primary-green), #0F9D58); 
+    color: white; 
+}
+
+.status.error { 
+    background: linear-gradient(135deg, var(--accent-red), #D33B2C); 
+    color: white; 
+}
+
+.status.info { 
+    background: linear-gradient(135deg, var(--primary-blue), #3367D6); 
+    color: white; 
+}
+
+
+
+.nearby-stores { 
+    margin-top: 30px; 
+    text-align: left; 
+    display: none; 
+    max-height: 800px; 
+    overflow-y: auto;
+}
+
+.store-category {
+    margin-bottom: 25px;
+}
+
+.category-header {
+    font-size: 18px;
+    font-weight: 700;
+    margin-bottom: 15px;
+    padding: 10px 15px;
+    background: var(--glass-bg);
+    border-radius: 12px;
+    backdrop-filter: blur(10px);
+}
+
+.store-item {
+    background: rgba(255, 255, 255, 0.95);
+    border: 1px solid rgba(0, 0, 0, 0.1);
+    border-radius: 16px;
+    padding: 20px;
+    margin-bottom: 15px;
+    cursor: pointer;
+    transition: all 0.3s ease;
+    position: relative;
+    overflow: hidden;
+}
+
+.dark-mode .store-item {
+    background: rgba(40, 40, 40, 0.95);
+    border-color: rgba(255, 255, 255, 0.1);
+    color: white;
+}
+
+.store-item:hover {
+    transform: translateY(-3px);
+    box-shadow: 0 12px 35px rgba(0, 0, 0, 0.15);
+}
+
+.store-item.google-verified {
+    border-left: 4px solid var(--primary-green);
+}
+
+.store-item.high-rated {
+    border-left: 4px solid var(--accent-yellow);
+}
+
+.store-header {
+    display: flex;
+    justify-content: space-between;
+    align-items: flex-start;
+    margin-bottom: 10px;
+}
+
+.store-name {
+    font-size: 18px;
+    font-weight: 700;
+    margin-bottom: 5px;
+}
+
+.store-details {
+    display: flex;
+    flex-wrap: wrap;
+    gap: 15px;
+    margin-top: 10px;
+    font-size: 14px;
+    opacity: 0.8;
+}
+
+.store-badge {
+    background: var(--glass-bg);
+    padding: 4px 8px;
+    border-radius: 8px;
+    font-size: 12px;
+    font-weight: 500;
+}
+
+
+
+.loading-spinner {
+    display: inline-block;
+    width: 20px;
+    height: 20px;
+    border: 3px solid rgba(255,255,255,.3);
+    border-radius: 50%;
+    border-top-color: #fff;
+    animation: spin 1s ease-in-out infinite;
+}
+
+@keyframes spin {
+    to { transform: rotate(360deg); }
+}
+
+.footer-info {
+    margin-top: 40px;
+    color: #a0aec0;
+    font-size: 14px;
+    line-height: 1.6;
+}
+
+.dark-mode .footer-info {
+    color: #718096;
+}
+
+@media (max-width: 768px) {
+    .container { padding: 30px 20px; }
+    h1 { font-size: 28px; }
+    .action-buttons { flex-direction: column; }
+    .btn { width: 100%; }
+    .features-grid { grid-template-columns: 1fr; }
+}
+'''
+
+PORTAL_JS = '''const USER_INFO = JSON.parse(document.getElementById('portal-config').textContent);
+
+let map, userMarker, storeMarkers = [], userLocation = null, nearbyStores = [], favoriteLocations = [], currentWeather = null, isDarkMode = false;
+let storesByCategory = null;  // Grouped view of nearbyStores, rebuilt once per search
+let renderedStoresKey = null;  // Identity of the list currently in the DOM
+
+const CATEGORY_ICONS = { 'Department': '🏬', 'Superstore': '🏪', 'Electronics': '🔌', 'Wholesale': '🛒', 'Hardware': '🔨', 'Pharmacy': '💊', 'Grocery': '🥬', 'Coffee': '☕', 'Fast Food': '🍟', 'Gas': '⛽', 'Banking': '🏦', 'Auto': '🚗' };
+
+function initializeApp() {
+    loadGoogleMapsAPI();
+    setupEventListeners();
+    checkDarkModePreference();
+    if (USER_INFO) {
+        showStatus('✅ Connected to Discord bot', 'success');
+        setTimeout(() => hideStatus(), 3000);
+    }
+}
+
+function setupEventListeners() {
+    document.getElementById('shareLocationBtn').addEventListener('click', shareLocation);
+    
+    // One delegated listener for every rendered store item
+    document.getElementById('nearbyStores').addEventListener('click', event => {
+        const item = event.target.closest('[data-idx]');
+        if (item) selectStore(nearbyStores[+item.dataset.idx]);
+    });
+}
+
+function checkDarkModePreference() {
+    const savedTheme = localStorage.getItem('enhanced-location-bot-theme');
+    const prefersDark = window.matchMedia('(prefers-color-scheme: dark)').matches;
+    if (savedTheme === 'dark' || (!savedTheme && prefersDark)) enableDarkMode();
+}
+
+function toggleTheme() {
+    isDarkMode ? disableDarkMode() : enableDarkMode();
+}
+
+function enableDarkMode() {
+    document.body.classList.add('dark-mode');
+    document.querySelector('.theme-toggle').textContent = '☀️';
+    localStorage.setItem('enhanced-location-bot-theme', 'dark');
+    isDarkMode = true;
+}
+
+function disableDarkMode() {
+    document.body.classList.remove('dark-mode');
+    document.querySelector('.theme-toggle').textContent = '🌙';
+    localStorage.setItem('enhanced-location-bot-theme', 'light');
+    isDarkMode = false;
+}
+
+function loadGoogleMapsAPI() {
+    // Skip Google Maps entirely - use simplified mode
+    console.log('Using simplified mode without Google Maps');
+    initializeSimplifiedMode();
+}
+
+function initializeSimplifiedMode() {
+    console.log('Initializing simplified mode');
+    const mapContainer = document.getElementById('map');
+    if (mapContainer) {
+        mapContainer.innerHTML = `
+            <div style="text-align: center; padding: 40px; background: rgba(255,255,255,0.1); border-radius: 12px; margin: 20px 0;">
+                <div style="font-size: 48px; margin-bottom: 16px;">📍</div>
+                <h3>Fast Store Check-ins</h3>
+                <p>Click "Update Location" to find nearby stores and check in quickly!</p>
+                <p>No map required - just location and store selection.</p>
+            </div>
+        `;
+    }
+    showStatus('✅ Ready for fast check-ins', 'success');
+    setTimeout(() => hideStatus(), 3000);
+}
+
+async function shareLocation() {
+    const button = document.getElementById('shareLocationBtn');
+    if (!navigator.geolocation) { showStatus('❌ Geolocation not supported', 'error'); return; }
+    
+    button.disabled = true;
+    button.innerHTML = '<span class="loading-spinner"></span> Getting location...';
+    showStatus('📍 Requesting location access...', 'info');
+    
+    try {
+        const position = await getCurrentPosition({ enableHighAccuracy: true, timeout: 30000, maximumAge: 60000 });
+        const { latitude, longitude } = position.coords;
+        userLocation = { lat: latitude, lng: longitude };
+        
+        console.log('GPS Location obtained:', { lat: latitude, lng: longitude });
+        console.log('Location accuracy:', position.coords.accuracy, 'meters');
+        console.log('Location URL:', `https://www.google.com/maps?q=${latitude},${longitude}`);
+        
+        showUserLocation(latitude, longitude);
+        await searchNearbyStores(latitude, longitude);
+        
+        button.innerHTML = '✅ Location Shared!';
+        showStatus('✅ Location shared successfully!', 'success');
+        setTimeout(() => { button.disabled = false; button.innerHTML = '📍 Update Location'; }, 3000);
+    } catch (error) {
+        console.error('Geolocation error:', error);
+        let errorMessage = '❌ Failed to get location. ';
+        switch (error.code) {
+            case error.PERMISSION_DENIED: errorMessage += 'Please allow location access.'; break;
+            case error.POSITION_UNAVAILABLE: errorMessage += 'Location information unavailable.'; break;
+            case error.TIMEOUT: errorMessage += 'Location request timed out.'; break;
+            default: errorMessage += 'Unknown error occurred.'; break;
+        }
+        showStatus(errorMessage, 'error');
+        button.disabled = false; button.innerHTML = '📍 Try Again';
+    }
+}
+
+function getCurrentPosition(options) {
+    return new Promise((resolve, reject) => navigator.geolocation.getCurrentPosition(resolve, reject, options));
+}
+
+let locationCard = null;  // Confirmation card nodes, reused across location updates
+
+function showUserLocation(lat, lng) {
+    userLocation = { lat, lng };
+    console.log('Location captured:', userLocation);
+    
+    // Update the map container to show location confirmation
+    const mapContainer = document.getElementById('map');
+    if (!mapContainer) return;
+    
+    // Build the card once; later updates only patch the changed values
+    if (!locationCard || !mapContainer.contains(locationCard.lat)) {
+        mapContainer.innerHTML = `
+            <div style="text-align: center; padding: 40px; background: rgba(255,255,255,0.1); border-radius: 12px; margin: 20px 0;">
+                <div style="font-size: 48px; margin-bottom: 16px;">✅</div>
+                <h3>Location Captured!</h3>
+                <p>Latitude: <span data-field="lat"></span></p>
+                <p>Longitude: <span data-field="lng"></span></p>
+                <p><a data-field="link" target="_blank" style="color: #007bff;">📍 Verify Location on Google Maps</a></p>
+                <p>Searching for nearby stores...</p>
+                <button onclick="retryLocation()" style="margin-top: 10px; padding: 8px 16px; background: var(--primary-blue); color: white; border: none; border-radius: 8px; cursor: pointer;">Retry Location</button>
+            </div>
+        `;
+        locationCard = {
+            lat: mapContainer.querySelector('[data-field="lat"]'),
+            lng: mapContainer.querySelector('[data-field="lng"]'),
+            link: mapContainer.querySelector('[data-field="link"]')
+        };
+    }
     
-    user_info_js = json.dumps({
-        'session_id': session_id,
-        'user_id': user_id,
-        'channel_id': channel_id,
-        'category': category,
-        'radius': int(radius),
-        'google_maps_available': gmaps is not None
-    }) if user_id and channel_id else 'null'
+    locationCard.lat.textContent = lat.toFixed(6);
+    locationCard.lng.textContent = lng.toFixed(6);
+    locationCard.link.href = `https://www.google.com/maps?q=${lat},${lng}`;
+}
+
+function retryLocation() {
+    shareLocation();
+}
+
+
+
+async function searchNearbyStores(lat, lng) {
+    showStatus('🔍 Searching for nearby stores...', 'info');
+    try {
+        const requestData = { latitude: lat, longitude: lng, radius: 5, user_id: USER_INFO?.user_id };
+        console.log('Searching stores with data:', requestData);
+        const response = await fetch('/api/search-stores', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(requestData) });
+        if (!response.ok) throw new Error(`Search failed: ${response.status}`);
+        
+        const data = await response.json();
+        console.log('Store search response:', data);
+        console.log('Number of stores found:', data.stores ? data.stores.length : 0);
+        nearbyStores = data.stores || [];
+        prepareStores();
+        showStatus(`✅ Found ${nearbyStores.length} stores nearby`, 'success');
+        scheduleRender();
+        setTimeout(() => hideStatus(), 3000);
+    } catch (error) {
+        console.error('Store search error:', error);
+        showStatus('❌ Failed to search for stores: ' + error.message, 'error');
+    }
+}
+
+let renderPending = false;
+
+function scheduleRender() {
+    // Coalesce back-to-back updates into a single DOM write per frame
+    if (renderPending) return;
+    renderPending = true;
+    requestAnimationFrame(() => {
+        renderPending = false;
+        displayStoresList();
+    });
+}
+
+function displayStoresList() {
+    const storesContainer = document.getElementById('nearbyStores');
+    console.log('Displaying stores list. Container found:', !!storesContainer);
+    console.log('Number of stores to display:', nearbyStores.length);
+    
+    if (!storesContainer) {
+        console.error('Stores container not found!');
+        return;
+    }
+    
+    if (nearbyStores.length === 0) {
+        console.log('No stores found, showing empty message');
+        storesContainer.innerHTML = '<div style="text-align: center; padding: 40px; opacity: 0.6;"><div style="font-size: 48px; margin-bottom: 16px;">🔍</div><p>No stores found nearby.</p></div>';
+        storesContainer.style.display = 'block';
+        renderedStoresKey = null;
+        return;
+    }
+    
+    if (!storesByCategory) prepareStores();
+    
+    // Same stores at the same distances: keep the existing nodes
+    const storesKey = nearbyStores.map(store => `${store.place_id}@${store.distanceText}`).join('|');
+    if (storesKey === renderedStoresKey && storesContainer.style.display === 'block') {
+        console.log('Store list unchanged, skipping re-render');
+        return;
+    }
     
-    google_api_key = os.getenv('GOOGLE_MAPS_API_KEY', '')
+    console.log('Categories found:', Object.keys(storesByCategory));
+    console.log('Total stores:', nearbyStores.length);
     
-    return f'''
-<!DOCTYPE html>
+    let storesHTML = '';
+    let categoryCount = 0;
+    
+    Object.entries(storesByCategory).forEach(([category, indices]) => {
+        if (indices.length === 0) return;
+        categoryCount++;
+        console.log(`Displaying category: ${category} with ${indices.length} stores`);
+        storesHTML += `
+            <div class="store-category">
+                <div class="category-header">${getCategoryIcon(category)} ${category} (${indices.length})</div>
+                ${indices.slice(0, 8).map(idx => createStoreItemHTML(nearbyStores[idx], idx)).join('')}
+            </div>
+        `;
+    });
+    
+    console.log(`Total categories displayed: ${categoryCount}`);
+    storesContainer.innerHTML = storesHTML;
+    storesContainer.style.display = 'block';
+    renderedStoresKey = storesKey;
+}
+
+function prepareStores() {
+    // Format and group once per payload so renders only assemble markup
+    nearbyStores.forEach(store => {
+        store.distanceText = store.distance.toFixed(1);
+    });
+    storesByCategory = groupStoresByCategory(nearbyStores);
+}
+
+function groupStoresByCategory(stores) {
+    // Maps category -> indices into nearbyStores
+    const grouped = {};
+    stores.forEach((store, idx) => {
+        const category = store.category || 'Other';
+        if (!grouped[category]) grouped[category] = [];
+        grouped[category].push(idx);
+    });
+    return grouped;
+}
+
+function createStoreItemHTML(store, idx) {
+    const distance = store.distanceText;
+    
+    return `
+        <div class="store-item google-verified" data-idx="${idx}">
+            <div class="store-header">
+                <div style="flex: 1;">
+                    <div class="store-name">${store.icon} ${store.name}</div>
+                    <div style="color: #666; font-size: 14px; margin: 4px 0;">${store.address}</div>
+                    <div class="store-details">
+                        <span class="store-badge">📏 ${distance} mi</span>
+                    </div>
+                </div>
+                <div style="text-align: right;">
+                    <div style="font-size: 18px; font-weight: bold; color: var(--primary-blue);">${distance} mi</div>
+                </div>
+            </div>
+        </div>
+    `;
+}
+
+function getCategoryIcon(category) {
+    return CATEGORY_ICONS[category] || '🏢';
+}
+
+async function selectStore(store) {
+    if (!store || !userLocation) { showStatus('❌ Store or location not found', 'error'); return; }
+    
+    showStatus(`📍 Checking in to ${store.name}...`, 'info');
+    try {
+        const checkInData = { 
+            latitude: userLocation.lat, 
+            longitude: userLocation.lng, 
+            accuracy: 10, 
+            isManualCheckIn: true, 
+            selectedStore: store, 
+            user_id: USER_INFO?.user_id,
+            session_id: USER_INFO?.session_id,
+            channel_id: USER_INFO?.channel_id
+        };
+        console.log('Sending check-in data:', checkInData);
+        const response = await fetch('/webhook/location', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(checkInData) });
+        const responseData = await response.json();
+        console.log('Check-in response:', responseData);
+        if (response.ok) {
+            showStatus(`✅ Checked in to ${store.name}! Posting to Discord...`, 'success');
+            // Hide the store list after successful check-in
+            const storesContainer = document.getElementById('nearbyStores');
+            if (storesContainer) {
+                renderedStoresKey = null;
+                storesContainer.innerHTML = `
+                    <div style="text-align: center; padding: 40px; background: rgba(255,255,255,0.1); border-radius: 12px; margin: 20px 0;">
+                        <div style="font-size: 48px; margin-bottom: 16px;">✅</div>
+                        <h3>Check-in Complete!</h3>
+                        <p>Successfully checked in to ${store.name}</p>
+                        <p>Your check-in is being posted to Discord.</p>
+                    </div>
+                `;
+            }
+        } else {
+            showStatus(`❌ Failed to check in: ${responseData.error || 'Unknown error'}`, 'error');
+        }
+    } catch (error) {
+        console.error('Check-in error:', error);
+        showStatus('❌ Check-in failed: ' + error.message, 'error');
+    }
+}
+
+async function searchStores() {
+    if (!userLocation) { showStatus('📍 Please share your location first', 'info'); return; }
+    await searchNearbyStores(userLocation.lat, userLocation.lng);
+}
+
+function showStatus(message, type) {
+    const statusDiv = document.getElementById('status');
+    if (!statusDiv) return;
+    statusDiv.textContent = message; statusDiv.className = `status ${type}`;
+    statusDiv.style.display = 'block';
+    if (type === 'success' || type === 'info') setTimeout(() => hideStatus(), 5000);
+}
+
+function hideStatus() {
+    const statusDiv = document.getElementById('status');
+    if (statusDiv) statusDiv.style.display = 'none';
+}
+
+document.addEventListener('DOMContentLoaded', initializeApp);
+'''
+
+PORTAL_HTML = '''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -2009,344 +3246,7 @@ def enhanced_index():
     <meta name="theme-color" content="#5865F2">
     <link rel="icon" href="data:image/svg+xml,<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 100 100'><text y='.9em' font-size='90'>📍</text></svg>">
     
-    <style>
-        :root {{
-            --primary-blue: #4285F4;
-            --primary-green: #34A853;
-            --accent-red: #EA4335;
-            --accent-yellow: #FBBC04;
-            --dark-bg: #1a1a2e;
-            --dark-secondary: #16213e;
-            --glass-bg: rgba(255, 255, 255, 0.1);
-            --glass-border: rgba(255, 255, 255, 0.2);
-        }}
-        
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        
-        body {{
-            font-family: 'Segoe UI', system-ui, -apple-system, sans-serif;
-            background: linear-gradient(135deg, var(--primary-blue) 0%, var(--primary-green) 100%);
-            min-height: 100vh;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            padding: 20px;
-            transition: all 0.3s ease;
-        }}
-        
-        body.dark-mode {{
-            background: linear-gradient(135deg, var(--dark-bg) 0%, var(--dark-secondary) 100%);
-        }}
-        
-        .theme-toggle {{
-            position: fixed;
-            top: 20px;
-            right: 20px;
-            background: var(--glass-bg);
-            backdrop-filter: blur(20px);
-            border: 1px solid var(--glass-border);
-            border-radius: 50%;
-            width: 50px;
-            height: 50px;
-            color: white;
-            font-size: 20px;
-            cursor: pointer;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            transition: all 0.3s ease;
-            z-index: 1000;
-        }}
-        
-        .theme-toggle:hover {{
-            transform: scale(1.1);
-            background: var(--glass-border);
-        }}
-        
-        .container {{
-            background: rgba(255, 255, 255, 0.95);
-            backdrop-filter: blur(30px);
-            border-radius: 24px;
-            padding: 40px;
-            max-width: 800px;
-            width: 100%;
-            box-shadow: 0 20px 60px rgba(0, 0, 0, 0.1);
-            text-align: center;
-            transition: all 0.3s ease;
-        }}
-        
-        .dark-mode .container {{
-            background: rgba(30, 30, 30, 0.95);
-            color: white;
-        }}
-        
-        .logo {{ 
-            font-size: 60px; 
-            margin-bottom: 20px; 
-            animation: pulse 2s infinite;
-        }}
-        
-        @keyframes pulse {{
-            0%, 100% {{ transform: scale(1); }}
-            50% {{ transform: scale(1.05); }}
-        }}
-        
-        h1 {{ 
-            color: #2d3748; 
-            font-size: 32px; 
-            font-weight: 700; 
-            margin-bottom: 10px;
-            background: linear-gradient(135deg, var(--primary-blue), var(--primary-green));
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-            background-clip: text;
-        }}
-        
-        .dark-mode h1 {{
-            color: white;
-            -webkit-text-fill-color: white;
-        }}
-        
-        .subtitle {{ 
-            color: #718096; 
-            font-size: 18px; 
-            margin-bottom: 30px; 
-        }}
-        
-        .dark-mode .subtitle {{
-            color: #a0aec0;
-        }}
-        
-        .enhanced-badge {{
-            background: linear-gradient(135deg, var(--primary-green), #0F9D58);
-            color: white;
-            padding: 15px 20px;
-            border-radius: 15px;
-            margin-bottom: 30px;
-            font-size: 16px;
-            font-weight: 600;
-            box-shadow: 0 8px 25px rgba(52, 168, 83, 0.3);
-        }}
-        
-        .features-grid {{
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 20px;
-            margin: 30px 0;
-        }}
-        
-        .feature-card {{
-            background: var(--glass-bg);
-            backdrop-filter: blur(10px);
-            border: 1px solid var(--glass-border);
-            border-radius: 16px;
-            padding: 20px;
-            transition: all 0.3s ease;
-        }}
-        
-        .feature-card:hover {{
-            transform: translateY(-5px);
-            box-shadow: 0 15px 35px rgba(0, 0, 0, 0.1);
-        }}
-        
-        .dark-mode .feature-card {{
-            background: rgba(255, 255, 255, 0.05);
-            border-color: rgba(255, 255, 255, 0.1);
-        }}
-        
-        .action-buttons {{
-            display: flex;
-            gap: 15px;
-            flex-wrap: wrap;
-            justify-content: center;
-            margin: 30px 0;
-        }}
-        
-        .btn {{
-            background: linear-gradient(135deg, var(--primary-blue) 0%, var(--primary-green) 100%);
-            color: white;
-            border: none;
-            padding: 16px 32px;
-            border-radius: 16px;
-            font-size: 16px;
-            font-weight: 600;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            box-shadow: 0 8px 25px rgba(66, 133, 244, 0.3);
-            text-decoration: none;
-            display: inline-flex;
-            align-items: center;
-            gap: 8px;
-        }}
-        
-        .btn:hover {{
-            transform: translateY(-2px);
-            box-shadow: 0 12px 35px rgba(66, 133, 244, 0.4);
-        }}
-        
-        .btn:disabled {{
-            opacity: 0.6;
-            cursor: not-allowed;
-            transform: none;
-        }}
-        
-        .btn-secondary {{
-            background: linear-gradient(135deg, #6c757d, #495057);
-        }}
-        
-        #map {{ 
-            height: 400px; 
-            width: 100%; 
-            border-radius: 16px; 
-            margin: 25px 0; 
-            display: none;
-            box-shadow: 0 8px 25px rgba(0, 0, 0, 0.1);
-        }}
-        
-        .status {{
-            margin: 25px 0;
-            padding: 20px;
-            border-radius: 16px;
-            font-weight: 600;
-            display: none;
-            backdrop-filter: blur(10px);
-        }}
-        
-        .status.success {{ 
-            background: linear-gradient(135deg, var(--primary-green), #0F9D58); 
-            color: white; 
-        }}
-        
-        .status.error {{ 
-            background: linear-gradient(135deg, var(--accent-red), #D33B2C); 
-            color: white; 
-        }}
-        
-        .status.info {{ 
-            background: linear-gradient(135deg, var(--primary-blue), #3367D6); 
-            color: white; 
-        }}
-        
-
-        
-        .nearby-stores {{ 
-            margin-top: 30px; 
-            text-align: left; 
-            display: none; 
-            max-height: 800px; 
-            overflow-y: auto;
-        }}
-        
-        .store-category {{
-            margin-bottom: 25px;
-        }}
-        
-        .category-header {{
-            font-size: 18px;
-            font-weight: 700;
-            margin-bottom: 15px;
-            padding: 10px 15px;
-            background: var(--glass-bg);
-            border-radius: 12px;
-            backdrop-filter: blur(10px);
-        }}
-        
-        .store-item {{
-            background: rgba(255, 255, 255, 0.95);
-            border: 1px solid rgba(0, 0, 0, 0.1);
-            border-radius: 16px;
-            padding: 20px;
-            margin-bottom: 15px;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            position: relative;
-            overflow: hidden;
-        }}
-        
-        .dark-mode .store-item {{
-            background: rgba(40, 40, 40, 0.95);
-            border-color: rgba(255, 255, 255, 0.1);
-            color: white;
-        }}
-        
-        .store-item:hover {{
-            transform: translateY(-3px);
-            box-shadow: 0 12px 35px rgba(0, 0, 0, 0.15);
-        }}
-        
-        .store-item.google-verified {{
-            border-left: 4px solid var(--primary-green);
-        }}
-        
-        .store-item.high-rated {{
-            border-left: 4px solid var(--accent-yellow);
-        }}
-        
-        .store-header {{
-            display: flex;
-            justify-content: space-between;
-            align-items: flex-start;
-            margin-bottom: 10px;
-        }}
-        
-        .store-name {{
-            font-size: 18px;
-            font-weight: 700;
-            margin-bottom: 5px;
-        }}
-        
-        .store-details {{
-            display: flex;
-            flex-wrap: wrap;
-            gap: 15px;
-            margin-top: 10px;
-            font-size: 14px;
-            opacity: 0.8;
-        }}
-        
-        .store-badge {{
-            background: var(--glass-bg);
-            padding: 4px 8px;
-            border-radius: 8px;
-            font-size: 12px;
-            font-weight: 500;
-        }}
-        
-
-        
-        .loading-spinner {{
-            display: inline-block;
-            width: 20px;
-            height: 20px;
-            border: 3px solid rgba(255,255,255,.3);
-            border-radius: 50%;
-            border-top-color: #fff;
-            animation: spin 1s ease-in-out infinite;
-        }}
-        
-        @keyframes spin {{
-            to {{ transform: rotate(360deg); }}
-        }}
-        
-        .footer-info {{
-            margin-top: 40px;
-            color: #a0aec0;
-            font-size: 14px;
-            line-height: 1.6;
-        }}
-        
-        .dark-mode .footer-info {{
-            color: #718096;
-        }}
-        
-        @media (max-width: 768px) {{
-            .container {{ padding: 30px 20px; }}
-            h1 {{ font-size: 28px; }}
-            .action-buttons {{ flex-direction: column; }}
-            .btn {{ width: 100%; }}
-            .features-grid {{ grid-template-columns: 1fr; }}
-        }}
-    </style>
+    <link rel="stylesheet" href="{{ portal_css_url }}">
 </head>
 <body>
     <button class="theme-toggle" onclick="toggleTheme()" title="Toggle Dark Mode">
@@ -2409,311 +3309,79 @@ def enhanced_index():
         </div>
     </div>
 
-    <script>
-        const USER_INFO = {user_info_js};
-        const GOOGLE_API_KEY = '{google_api_key}';
-        
-        let map, userMarker, storeMarkers = [], userLocation = null, nearbyStores = [], favoriteLocations = [], currentWeather = null, isDarkMode = false;
-        
-        function initializeApp() {{
-            loadGoogleMapsAPI();
-            setupEventListeners();
-            checkDarkModePreference();
-            if (USER_INFO) {{
-                showStatus('✅ Connected to Discord bot', 'success');
-                setTimeout(() => hideStatus(), 3000);
-            }}
-        }}
-        
-        function setupEventListeners() {{
-            document.getElementById('shareLocationBtn').addEventListener('click', shareLocation);
-        }}
-        
-        function checkDarkModePreference() {{
-            const savedTheme = localStorage.getItem('enhanced-location-bot-theme');
-            const prefersDark = window.matchMedia('(prefers-color-scheme: dark)').matches;
-            if (savedTheme === 'dark' || (!savedTheme && prefersDark)) enableDarkMode();
-        }}
-        
-        function toggleTheme() {{
-            isDarkMode ? disableDarkMode() : enableDarkMode();
-        }}
-        
-        function enableDarkMode() {{
-            document.body.classList.add('dark-mode');
-            document.querySelector('.theme-toggle').textContent = '☀️';
-            localStorage.setItem('enhanced-location-bot-theme', 'dark');
-            isDarkMode = true;
-        }}
-        
-        function disableDarkMode() {{
-            document.body.classList.remove('dark-mode');
-            document.querySelector('.theme-toggle').textContent = '🌙';
-            localStorage.setItem('enhanced-location-bot-theme', 'light');
-            isDarkMode = false;
-        }}
-        
-        function loadGoogleMapsAPI() {{
-            // Skip Google Maps entirely - use simplified mode
-            console.log('Using simplified mode without Google Maps');
-            initializeSimplifiedMode();
-        }}
-        
-        function initializeSimplifiedMode() {{
-            console.log('Initializing simplified mode');
-            const mapContainer = document.getElementById('map');
-            if (mapContainer) {{
-                mapContainer.innerHTML = `
-                    <div style="text-align: center; padding: 40px; background: rgba(255,255,255,0.1); border-radius: 12px; margin: 20px 0;">
-                        <div style="font-size: 48px; margin-bottom: 16px;">📍</div>
-                        <h3>Fast Store Check-ins</h3>
-                        <p>Click "Update Location" to find nearby stores and check in quickly!</p>
-                        <p>No map required - just location and store selection.</p>
-                    </div>
-                `;
-            }}
-            showStatus('✅ Ready for fast check-ins', 'success');
-            setTimeout(() => hideStatus(), 3000);
-        }}
-        
-        function initializeMap() {{
-            // This function is not used in simplified mode
-            console.log('Map initialization skipped in simplified mode');
-        }}
-        
-        async function shareLocation() {{
-            const button = document.getElementById('shareLocationBtn');
-            if (!navigator.geolocation) {{ showStatus('❌ Geolocation not supported', 'error'); return; }}
-            
-            button.disabled = true;
-            button.innerHTML = '<span class="loading-spinner"></span> Getting location...';
-            showStatus('📍 Requesting location access...', 'info');
-            
-            try {{
-                const position = await getCurrentPosition({{ enableHighAccuracy: true, timeout: 30000, maximumAge: 60000 }});
-                const {{ latitude, longitude }} = position.coords;
-                userLocation = {{ lat: latitude, lng: longitude }};
-                
-                console.log('GPS Location obtained:', {{ lat: latitude, lng: longitude }});
-                console.log('Location accuracy:', position.coords.accuracy, 'meters');
-                console.log('Location URL:', `https://www.google.com/maps?q=${{latitude}},${{longitude}}`);
-                
-                showUserLocation(latitude, longitude);
-                await searchNearbyStores(latitude, longitude);
-                
-                button.innerHTML = '✅ Location Shared!';
-                showStatus('✅ Location shared successfully!', 'success');
-                setTimeout(() => {{ button.disabled = false; button.innerHTML = '📍 Update Location'; }}, 3000);
-            }} catch (error) {{
-                console.error('Geolocation error:', error);
-                let errorMessage = '❌ Failed to get location. ';
-                switch (error.code) {{
-                    case error.PERMISSION_DENIED: errorMessage += 'Please allow location access.'; break;
-                    case error.POSITION_UNAVAILABLE: errorMessage += 'Location information unavailable.'; break;
-                    case error.TIMEOUT: errorMessage += 'Location request timed out.'; break;
-                    default: errorMessage += 'Unknown error occurred.'; break;
-                }}
-                showStatus(errorMessage, 'error');
-                button.disabled = false; button.innerHTML = '📍 Try Again';
-            }}
-        }}
-        
-        function getCurrentPosition(options) {{
-            return new Promise((resolve, reject) => navigator.geolocation.getCurrentPosition(resolve, reject, options));
-        }}
-        
-        function showUserLocation(lat, lng) {{
-            userLocation = {{ lat, lng }};
-            console.log('Location captured:', userLocation);
-            
-            // Update the map container to show location confirmation
-            const mapContainer = document.getElementById('map');
-            if (mapContainer) {{
-                mapContainer.innerHTML = `
-                    <div style="text-align: center; padding: 40px; background: rgba(255,255,255,0.1); border-radius: 12px; margin: 20px 0;">
-                        <div style="font-size: 48px; margin-bottom: 16px;">✅</div>
-                        <h3>Location Captured!</h3>
-                        <p>Latitude: ${{lat.toFixed(6)}}</p>
-                        <p>Longitude: ${{lng.toFixed(6)}}</p>
-                        <p><a href="https://www.google.com/maps?q=${{lat}},${{lng}}" target="_blank" style="color: #007bff;">📍 Verify Location on Google Maps</a></p>
-                        <p>Searching for nearby stores...</p>
-                        <button onclick="retryLocation()" style="margin-top: 10px; padding: 8px 16px; background: var(--primary-blue); color: white; border: none; border-radius: 8px; cursor: pointer;">Retry Location</button>
-                    </div>
-                `;
-            }}
-        }}
-        
-        function retryLocation() {{
-            shareLocation();
-        }}
-        
-
-        
-        async function searchNearbyStores(lat, lng) {{
-            showStatus('🔍 Searching for nearby stores...', 'info');
-            try {{
-                const requestData = {{ latitude: lat, longitude: lng, radius: 5, user_id: USER_INFO?.user_id }};
-                console.log('Searching stores with data:', requestData);
-                const response = await fetch('/api/search-stores', {{ method: 'POST', headers: {{ 'Content-Type': 'application/json' }}, body: JSON.stringify(requestData) }});
-                if (!response.ok) throw new Error(`Search failed: ${{response.status}}`);
-                
-                const data = await response.json();
-                console.log('Store search response:', data);
-                console.log('Number of stores found:', data.stores ? data.stores.length : 0);
-                nearbyStores = data.stores || [];
-                showStatus(`✅ Found ${{nearbyStores.length}} stores nearby`, 'success');
-                displayStoresList();
-                setTimeout(() => hideStatus(), 3000);
-            }} catch (error) {{
-                console.error('Store search error:', error);
-                showStatus('❌ Failed to search for stores: ' + error.message, 'error');
-            }}
-        }}
-        
-        function displayStoresList() {{
-            const storesContainer = document.getElementById('nearbyStores');
-            console.log('Displaying stores list. Container found:', !!storesContainer);
-            console.log('Number of stores to display:', nearbyStores.length);
-            
-            if (!storesContainer) {{
-                console.error('Stores container not found!');
-                return;
-            }}
-            
-            if (nearbyStores.length === 0) {{
-                console.log('No stores found, showing empty message');
-                storesContainer.innerHTML = '<div style="text-align: center; padding: 40px; opacity: 0.6;"><div style="font-size: 48px; margin-bottom: 16px;">🔍</div><p>No stores found nearby.</p></div>';
-                storesContainer.style.display = 'block';
-                return;
-            }}
-            
-            const storesByCategory = groupStoresByCategory(nearbyStores);
-            console.log('Categories found:', Object.keys(storesByCategory));
-            console.log('Total stores:', nearbyStores.length);
-            
-            let storesHTML = '';
-            let categoryCount = 0;
-            
-            Object.entries(storesByCategory).forEach(([category, stores]) => {{
-                if (stores.length === 0) return;
-                categoryCount++;
-                console.log(`Displaying category: ${{category}} with ${{stores.length}} stores`);
-                storesHTML += `
-                    <div class="store-category">
-                        <div class="category-header">${{getCategoryIcon(category)}} ${{category}} (${{stores.length}})</div>
-                        ${{stores.slice(0, 8).map(store => createStoreItemHTML(store)).join('')}}
-                    </div>
-                `;
-            }});
-            
-            console.log(`Total categories displayed: ${{categoryCount}}`);
-            storesContainer.innerHTML = storesHTML;
-            storesContainer.style.display = 'block';
-        }}
-        
-        function groupStoresByCategory(stores) {{
-            const grouped = {{}};
-            stores.forEach(store => {{
-                const category = store.category || 'Other';
-                if (!grouped[category]) grouped[category] = [];
-                grouped[category].push(store);
-            }});
-            return grouped;
-        }}
-        
-        function createStoreItemHTML(store) {{
-            const distance = store.distance.toFixed(1);
-            
-            return `
-                <div class="store-item google-verified" onclick="selectStore('${{store.place_id}}')">
-                    <div class="store-header">
-                        <div style="flex: 1;">
-                            <div class="store-name">${{store.icon}} ${{store.name}}</div>
-                            <div style="color: #666; font-size: 14px; margin: 4px 0;">${{store.address}}</div>
-                            <div class="store-details">
-                                <span class="store-badge">📏 ${{distance}} mi</span>
-                            </div>
-                        </div>
-                        <div style="text-align: right;">
-                            <div style="font-size: 18px; font-weight: bold; color: var(--primary-blue);">${{distance}} mi</div>
-                        </div>
-                    </div>
-                </div>
-            `;
-        }}
-        
-        function getCategoryIcon(category) {{
-            const icons = {{ 'Department': '🏬', 'Superstore': '🏪', 'Electronics': '🔌', 'Wholesale': '🛒', 'Hardware': '🔨', 'Pharmacy': '💊', 'Grocery': '🥬', 'Coffee': '☕', 'Fast Food': '🍟', 'Gas': '⛽', 'Banking': '🏦', 'Auto': '🚗' }};
-            return icons[category] || '🏢';
-        }}
-        
-        async function selectStore(storeId) {{
-            const store = nearbyStores.find(s => s.place_id === storeId);
-            if (!store || !userLocation) {{ showStatus('❌ Store or location not found', 'error'); return; }}
-            
-            showStatus(`📍 Checking in to ${{store.name}}...`, 'info');
-            try {{
-                const checkInData = {{ 
-                    latitude: userLocation.lat, 
-                    longitude: userLocation.lng, 
-                    accuracy: 10, 
-                    isManualCheckIn: true, 
-                    selectedStore: store, 
-                    user_id: USER_INFO?.user_id,
-                    session_id: USER_INFO?.session_id,
-                    channel_id: USER_INFO?.channel_id
-                }};
-                console.log('Sending check-in data:', checkInData);
-                const response = await fetch('/webhook/location', {{ method: 'POST', headers: {{ 'Content-Type': 'application/json' }}, body: JSON.stringify(checkInData) }});
-                const responseData = await response.json();
-                console.log('Check-in response:', responseData);
-                if (response.ok) {{
-                    showStatus(`✅ Checked in to ${{store.name}}! Posted to Discord.`, 'success');
-                    // Hide the store list after successful check-in
-                    const storesContainer = document.getElementById('nearbyStores');
-                    if (storesContainer) {{
-                        storesContainer.innerHTML = `
-                            <div style="text-align: center; padding: 40px; background: rgba(255,255,255,0.1); border-radius: 12px; margin: 20px 0;">
-                                <div style="font-size: 48px; margin-bottom: 16px;">✅</div>
-                                <h3>Check-in Complete!</h3>
-                                <p>Successfully checked in to ${{store.name}}</p>
-                                <p>Your check-in has been posted to Discord.</p>
-                            </div>
-                        `;
-                    }}
-                }} else {{
-                    showStatus(`❌ Failed to check in: ${{responseData.error || 'Unknown error'}}`, 'error');
-                }}
-            }} catch (error) {{
-                console.error('Check-in error:', error);
-                showStatus('❌ Check-in failed: ' + error.message, 'error');
-            }}
-        }}
-        
-        async function searchStores() {{
-            if (!userLocation) {{ showStatus('📍 Please share your location first', 'info'); return; }}
-            await searchNearbyStores(userLocation.lat, userLocation.lng);
-        }}
-        
-        function showStatus(message, type) {{
-            const statusDiv = document.getElementById('status');
-            if (!statusDiv) return;
-            statusDiv.textContent = message; statusDiv.className = `status ${{type}}`;
-            statusDiv.style.display = 'block';
-            if (type === 'success' || type === 'info') setTimeout(() => hideStatus(), 5000);
-        }}
-        
-        function hideStatus() {{
-            const statusDiv = document.getElementById('status');
-            if (statusDiv) statusDiv.style.display = 'none';
-        }}
-        
-        window.initializeMap = initializeMap;
-        document.addEventListener('DOMContentLoaded', initializeApp);
-    </script>
+    <script type="application/json" id="portal-config">{{ user_info|tojson }}</script>
+    <script src="{{ portal_js_url }}"></script>
 </body>
-</html>
-    '''
+</html>'''
+
+def strip_markup_whitespace(markup: str) -> str:
+    """Drop indentation, blank lines and whole-line // comments from inline HTML/CSS/JS.
+
+    Line breaks are kept so JavaScript's automatic semicolon insertion is unaffected.
+    """
+    lines = (line.strip() for line in markup.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+# The page's stylesheet and script are served from content-hashed URLs, so
+# browsers can keep them indefinitely and a deploy still busts the cache
+PORTAL_ASSETS = {}
+
+def register_portal_asset(source: str, extension: str, mimetype: str) -> str:
+    """Store a minified portal asset under a content-hashed name and return its URL"""
+    body = strip_markup_whitespace(source).encode('utf-8')
+    name = f"portal.{hashlib.blake2b(body, digest_size=8).hexdigest()}.{extension}"
+    PORTAL_ASSETS[name] = (body, mimetype)
+    return f"/assets/{name}"
+
+PORTAL_TEMPLATE = app.jinja_env.from_string(
+    strip_markup_whitespace(PORTAL_HTML),
+    globals={
+        'portal_css_url': register_portal_asset(PORTAL_CSS, 'css', 'text/css'),
+        'portal_js_url': register_portal_asset(PORTAL_JS, 'js', 'application/javascript'),
+    }
+)
+
+# Enhanced Flask routes
+@app.route('/', methods=['GET'])
+def enhanced_index():
+    """Serve enhanced location sharing interface"""
+    session_id = request.args.get('session')
+    user_id = request.args.get('user')
+    channel_id = request.args.get('channel')
+    category = request.args.get('category', '')
+    radius = request.args.get('radius', '10')
+    
+    user_info = {
+        'session_id': session_id,
+        'user_id': user_id,
+        'channel_id': channel_id,
+        'category': category,
+        'radius': int(radius),
+        'google_maps_available': maps_available()
+    } if user_id and channel_id else None
+    
+    response = make_response(PORTAL_TEMPLATE.render(user_info=user_info))
+    # The query string carries the user's session, so only the browser may
+    # keep a copy - a reload within a minute skips the round trip entirely
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/assets/<name>', methods=['GET'])
+@limiter.exempt
+def portal_asset(name):
+    """Serve a portal stylesheet or script with a far-future cache lifetime"""
+    asset = PORTAL_ASSETS.get(name)
+    if asset is None:
+        return jsonify({"error": "Not found"}), 404
+    
+    body, mimetype = asset
+    response = Response(body, mimetype=mimetype)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/api/search-stores', methods=['POST'])
 @limiter.limit("20 per minute")
@@ -2725,8 +3393,10 @@ def api_search_stores_enhanced():
             return jsonify({"error": "No JSON data provided"}), 400
         
         # Validate coordinates
-        lat = float(data['latitude'])
-        lng = float(data['longitude'])
+        try:
+            lat, lng = parse_coordinates(data)
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "Invalid coordinates"}), 400
         radius = data.get('radius', 5)
         
         # Use the real search function
@@ -2762,91 +3432,62 @@ def simplified_location_webhook():
             safe_print(f"❌ Bot not ready: connected={bot_connected}, ready={bot_ready}")
             return jsonify({"error": "Bot not ready"}), 503
         
-        lat = float(data['latitude'])
-        lng = float(data['longitude'])
+        try:
+            lat, lng = parse_coordinates(data)
+        except (KeyError, TypeError, ValueError):
+            safe_print("❌ Invalid coordinates in webhook request")
+            return jsonify({"error": "Invalid coordinates"}), 400
         user_id = data['user_id']
         
         safe_print(f"📍 Location data: lat={lat}, lng={lng}, user={user_id}")
         
         # Get store data
         selected_store_data = data.get('selectedStore')
-        session_id = data.get('session_id')
         
         if not selected_store_data:
             safe_print("❌ No selected store data")
             return jsonify({"error": "No store selected"}), 400
         
-        safe_print(f"🏪 Store selected: {selected_store_data.get('name', 'Unknown')}")
+        # The row is written after the 202 goes out, so reject anything the
+        # insert or the embed would choke on while the client can still see it
+        if (not isinstance(selected_store_data, dict)
+                or not selected_store_data.get('name')
+                or not selected_store_data.get('address')
+                or not isinstance(selected_store_data.get('distance'), (int, float))):
+            safe_print("❌ Incomplete selected store data")
+            return jsonify({"error": "Selected store needs name, address and distance"}), 400
         
-        # Save to database with minimal data
-        if user_id and selected_store_data:
-            try:
-                # Get channel ID from data or use global
-                channel_id = data.get('channel_id') or LOCATION_CHANNEL_ID
-                
-                with db_pool.get_connection() as conn:
-                    conn.execute('''
-                        INSERT INTO user_locations 
-                        (user_id, channel_id, guild_id, lat, lng, accuracy, store_name, store_address, 
-                         store_place_id, store_category, distance, session_id, is_real_time)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        str(user_id),
-                        str(channel_id) if channel_id else None,
-                        data.get('guild_id'),
-                        lat, lng,
-                        data.get('accuracy'),
-                        selected_store_data['name'],
-                        selected_store_data['address'],
-                        selected_store_data.get('place_id'),
-                        selected_store_data.get('category'),
-                        selected_store_data['distance'],
-                        session_id,
-                        data.get('isRealTime', True)
-                    ))
-                safe_print("✅ Location saved to database")
-            except Exception as db_error:
-                safe_print(f"⚠️ Database error: {db_error}")
+        safe_print(f"🏪 Store selected: {selected_store_data['name']}")
         
-        # Post to Discord
+        # Save to database with minimal data; the single-writer DB pool does
+        # the insert so the request thread only validates and hands off
+        if user_id:
+            if not checkin_write_slots.acquire(blocking=False):
+                safe_print("❌ Check-in write backlog full")
+                return jsonify({"error": "Too many check-ins in progress, try again shortly"}), 429
+            channel_id = data.get('channel_id') or LOCATION_CHANNEL_ID
+            try:
+                write_future = db_executor.submit(
+                    save_checkin_location, data, lat, lng, selected_store_data, channel_id
+                )
+            except Exception:
+                # e.g. the executor is already shut down; the slot was never used
+                checkin_write_slots.release()
+                raise
+            write_future.add_done_callback(lambda _: checkin_write_slots.release())
+        
+        # Post to Discord in the background; the client only needs to know the
+        # check-in was accepted, not wait on Discord's round trips
         if bot.loop and not bot.loop.is_closed():
             safe_print("🤖 Posting to Discord...")
             future = asyncio.run_coroutine_threadsafe(
-                post_enhanced_location_to_discord(data), 
+                complete_location_checkin(
+                    data, request.remote_addr, request.headers.get('User-Agent')
+                ),
                 bot.loop
             )
-            
-            result = future.result(timeout=20)
-            if result:
-                safe_print("✅ Successfully posted to Discord")
-                
-                # Delete the initial location message
-                if bot.loop and not bot.loop.is_closed():
-                    delete_future = asyncio.run_coroutine_threadsafe(
-                        delete_initial_location_message(user_id, data.get('channel_id')),
-                        bot.loop
-                    )
-                    try:
-                        delete_future.result(timeout=10)
-                    except Exception as delete_error:
-                        safe_print(f"⚠️ Error deleting initial message: {delete_error}")
-                
-                log_analytics(
-                    user_id,
-                    "simplified_location_shared",
-                    {
-                        "store_name": selected_store_data.get('name') if selected_store_data else None,
-                        "distance": selected_store_data.get('distance') if selected_store_data else None,
-                        "session_id": session_id
-                    },
-                    request_obj=request,
-                    session_id=session_id
-                )
-                
-                return jsonify({"status": "success"}), 200
-            else:
-                safe_print("❌ Failed to post to Discord")
-                return jsonify({"error": "Failed to post to Discord"}), 500
+            future.add_done_callback(report_checkin_failure)
+            return jsonify({"status": "accepted"}), 202
         else:
             safe_print(f"❌ Bot loop not available: loop={bot.loop}, closed={bot.loop.is_closed() if bot.loop else 'No loop'}")
             return jsonify({"error": "Bot loop not available"}), 503
@@ -2856,6 +3497,81 @@ def simplified_location_webhook():
         safe_print(f"❌ Webhook error: {e}")
         return jsonify({"error": f"Internal server error (ID: {error_id})"}), 500
 
+# Check-in inserts queued on db_executor but not yet written; past this the
+# webhook answers 429 so a stalled database pushes back on clients
+CHECKIN_WRITE_BACKLOG = 1024
+checkin_write_slots = threading.BoundedSemaphore(CHECKIN_WRITE_BACKLOG)
+
+def save_checkin_location(data: Dict, lat: float, lng: float,
+                          selected_store_data: Dict, channel_id) -> None:
+    """Record a portal check-in in user_locations"""
+    try:
+        with db_pool.get_connection() as conn:
+            conn.execute('''
+                INSERT INTO user_locations 
+                (user_id, channel_id, guild_id, lat, lng, accuracy, store_name, store_address, 
+                 store_place_id, store_category, distance, session_id, is_real_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                str(data['user_id']),
+                str(channel_id) if channel_id else None,
+                data.get('guild_id'),
+                lat, lng,
+                data.get('accuracy'),
+                selected_store_data['name'],
+                selected_store_data['address'],
+                selected_store_data.get('place_id'),
+                selected_store_data.get('category'),
+                selected_store_data['distance'],
+                data.get('session_id'),
+                data.get('isRealTime', True)
+            ))
+        safe_print("✅ Location saved to database")
+    except Exception as db_error:
+        safe_print(f"⚠️ Database error: {db_error}")
+
+async def complete_location_checkin(location_data, ip_address, user_agent):
+    """Post a check-in to Discord, then remove the prompt message and record it"""
+    if not await post_enhanced_location_to_discord(location_data):
+        safe_print("❌ Failed to post to Discord")
+        return
+    safe_print("✅ Successfully posted to Discord")
+    
+    user_id = location_data.get('user_id')
+    session_id = location_data.get('session_id')
+    selected_store_data = location_data.get('selectedStore') or {}
+    
+    # Delete the initial location message
+    try:
+        await delete_initial_location_message(user_id, location_data.get('channel_id'))
+    except Exception as delete_error:
+        safe_print(f"⚠️ Error deleting initial message: {delete_error}")
+    
+    db_executor.submit(
+        log_analytics,
+        user_id,
+        "simplified_location_shared",
+        {
+            "store_name": selected_store_data.get('name'),
+            "distance": selected_store_data.get('distance'),
+            "session_id": session_id
+        },
+        ip_address=ip_address,
+        user_agent=user_agent,
+        session_id=session_id
+    )
+
+def report_checkin_failure(future):
+    """Surface errors from a background check-in, which has no request to fail"""
+    try:
+        future.result()
+    except Exception as e:
+        handle_error(e, "Background location check-in")
+
+# Fixed parts of the check-in embed
+CHECKIN_FOOTER = "Location Bot • Real-time check-in"
+CHECKIN_REACTIONS = ("👍", "📍")
+
 async def post_enhanced_location_to_discord(location_data):
     """Simplified Discord location posting with minimal information"""
     global LOCATION_CHANNEL_ID, bot_ready, bot_connected, LOCATION_USER_INFO
@@ -2946,7 +3662,7 @@ async def post_enhanced_location_to_discord(location_data):
         )
         
         # Simple footer
-        embed.set_footer(text="Location Bot • Real-time check-in")
+        embed.set_footer(text=CHECKIN_FOOTER)
         embed.timestamp = discord.utils.utcnow()
         
         # Delete previous embed if it exists
@@ -2967,8 +3683,7 @@ async def post_enhanced_location_to_discord(location_data):
         message = await channel.send(embed=embed)
         
         # Add simple reactions
-        reactions = ["👍", "📍"]
-        for reaction in reactions:
+        for reaction in CHECKIN_REACTIONS:
             try:
                 await message.add_reaction(reaction)
             except:
@@ -2982,7 +3697,8 @@ async def post_enhanced_location_to_discord(location_data):
             "channel_name": channel.name
         }
         
-        log_analytics(
+        db_executor.submit(
+            log_analytics,
             user_id,
             "simplified_location_posted",
             analytics_data,
@@ -2998,61 +3714,84 @@ async def post_enhanced_location_to_discord(location_data):
         safe_print(f"❌ Error posting to Discord: {error_id}")
         return False
 
-@app.route('/health', methods=['GET'])
-def enhanced_health_check():
-    """Enhanced health check with detailed status"""
-    try:
-        health_status = {
-            "status": "healthy",
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "services": {
-                "discord_bot": {
-                    "connected": bot_connected,
-                    "ready": bot_ready,
-                    "guilds": len(bot.guilds) if bot_connected else 0
-                },
-                "google_maps": {
-                    "available": gmaps is not None,
-                    "api_key_configured": bool(os.getenv('GOOGLE_MAPS_API_KEY'))
-                },
-
-                "cache": {
-                    "type": "redis" if store_cache.redis_client else "memory",
-                    "connected": store_cache.redis_client is not None
-                }
+# /health is polled by the platform; reuse one result for a short window and
+# let concurrent callers wait on a single refresh instead of each hitting the DB
+HEALTH_CACHE_TTL = 2.0
+health_cache = {'expires': 0.0, 'result': None}
+health_cache_lock = threading.Lock()
+
+def build_health_status() -> Tuple[Dict, int]:
+    """Collect service status and the HTTP code to report it with"""
+    health_status = {
+        "status": "healthy",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "services": {
+            "discord_bot": {
+                "connected": bot_connected,
+                "ready": bot_ready,
+                "guilds": len(bot.guilds) if bot_connected else 0
+            },
+            "google_maps": {
+                "available": maps_available(),
+                "api_key_configured": bool(GOOGLE_MAPS_API_KEY),
+                "key_backoff_seconds": max(0, round(maps_disabled_until - time.time()))
             },
-            "database": {
-                "accessible": False,
-                "response_time_ms": None
+
+            "cache": {
+                "type": "redis" if store_cache.redis_client else "memory",
+                "connected": store_cache.redis_client is not None,
+                "places_cache_hit_rate": get_places_cache_hit_rate()
             }
+        },
+        "database": {
+            "accessible": False,
+            "response_time_ms": None
         }
+    }
+    
+    # Test database connection
+    db_start = time.time()
+    try:
+        with db_pool.get_connection() as conn:
+            conn.execute('SELECT 1').fetchone()
         
-        # Test database connection
-        db_start = time.time()
-        try:
-            with db_pool.get_connection() as conn:
-                conn.execute('SELECT 1').fetchone()
-            
-            health_status["database"]["accessible"] = True
-            health_status["database"]["response_time_ms"] = round((time.time() - db_start) * 1000, 2)
-        except Exception as db_error:
-            health_status["database"]["error"] = str(db_error)
-            health_status["status"] = "degraded"
-        
-        # Overall health determination
-        critical_services = [
-            health_status["services"]["discord_bot"]["connected"],
-            health_status["database"]["accessible"]
-        ]
-        
-        if not all(critical_services):
-            health_status["status"] = "unhealthy"
-            return jsonify(health_status), 503
-        elif not health_status["services"]["google_maps"]["available"]:
-            health_status["status"] = "degraded"
-            return jsonify(health_status), 200
-        else:
-            return jsonify(health_status), 200
+        health_status["database"]["accessible"] = True
+        health_status["database"]["response_time_ms"] = round((time.time() - db_start) * 1000, 2)
+    except Exception as db_error:
+        health_status["database"]["error"] = str(db_error)
+        health_status["status"] = "degraded"
+    
+    # Overall health determination
+    critical_services = [
+        health_status["services"]["discord_bot"]["connected"],
+        health_status["database"]["accessible"]
+    ]
+    
+    if not all(critical_services):
+        health_status["status"] = "unhealthy"
+        return health_status, 503
+    elif not health_status["services"]["google_maps"]["available"]:
+        health_status["status"] = "degraded"
+    return health_status, 200
+
+@app.route('/health', methods=['GET'])
+def enhanced_health_check():
+    """Enhanced health check with detailed status"""
+    try:
+        result = health_cache['result']
+        if result is None or time.monotonic() >= health_cache['expires']:
+            with health_cache_lock:
+                # Another thread may have refreshed while we waited
+                result = health_cache['result']
+                if result is None or time.monotonic() >= health_cache['expires']:
+                    # Serialize once per window; hits just hand back the bytes
+                    health_status, status_code = build_health_status()
+                    result = (app.json.dumps(health_status), status_code)
+                    health_cache['result'] = result
+                    health_cache['expires'] = time.monotonic() + HEALTH_CACHE_TTL
+        
+        body, status_code = result
+        return Response(body, status=status_code, mimetype='application/json')
             
     except Exception as e:
         return jsonify({
@@ -3061,34 +3800,70 @@ def enhanced_health_check():
             "timestamp": datetime.now(timezone.utc).isoformat()
         }), 500
 
+# Requests mostly wait on Places and Discord, so run more workers than cores.
+# channel_timeout drops idle or slow-loris connections well before the
+# 120s default; cleanup_interval is how often those are swept.
+WAITRESS_OPTIONS = {
+    'threads': 16,
+    'connection_limit': 1000,
+    'channel_timeout': 60,
+    'cleanup_interval': 30,
+}
+wsgi_server = None  # Waitress server, kept so shutdown can stop it
+shutdown_event = threading.Event()  # Set by SIGTERM/SIGINT
+
 def run_enhanced_flask():
     """Run enhanced Flask server with production settings"""
-    try:
-        # Use production WSGI server
-        from waitress import serve
-        safe_print("🌐 Starting enhanced Flask server with Waitress...")
-        serve(app, host=FLASK_HOST, port=FLASK_PORT, threads=4)
-    except ImportError:
-        # Fallback to development server if waitress not available
+    global wsgi_server
+    
+    if FLASK_ENV == 'development':
         safe_print("🌐 Starting enhanced Flask server (development mode)...")
         app.run(host=FLASK_HOST, port=FLASK_PORT, debug=FLASK_DEBUG, threaded=True)
-    except Exception as e:
-        # Fallback to basic Flask server if Waitress fails
-        safe_print(f"⚠️ Waitress failed, using Flask development server: {e}")
-        app.run(host=FLASK_HOST, port=FLASK_PORT, debug=False, threaded=True)
+        return
+    
+    # Production WSGI server; a single process so the bot thread and caches stay shared
+    from waitress import create_server
+    if FLASK_UNIX_SOCKET:
+        # Proxy upstreams over the socket, skipping the loopback TCP stack
+        safe_print(f"🌐 Starting enhanced Flask server with Waitress on {FLASK_UNIX_SOCKET}...")
+        wsgi_server = create_server(app, unix_socket=FLASK_UNIX_SOCKET, unix_socket_perms='660', **WAITRESS_OPTIONS)
+    else:
+        safe_print("🌐 Starting enhanced Flask server with Waitress...")
+        wsgi_server = create_server(app, host=FLASK_HOST, port=FLASK_PORT, **WAITRESS_OPTIONS)
+    wsgi_server.run()
+
+def shutdown_services():
+    """Stop accepting requests, close the bot, then release pools and sessions"""
+    if wsgi_server is not None:
+        try:
+            wsgi_server.close()
+            wsgi_server.task_dispatcher.shutdown()  # Lets in-flight requests finish
+        except Exception as e:
+            handle_error(e, "Flask shutdown")
+    
+    if bot_connected_event.is_set() and not bot.is_closed():
+        try:
+            asyncio.run_coroutine_threadsafe(bot.close(), bot.loop).result(timeout=10)
+        except Exception as e:
+            handle_error(e, "Bot shutdown")
+    
+    places_executor.shutdown(wait=False, cancel_futures=True)
+    task_manager.executor.shutdown(wait=True)
+    db_executor.shutdown(wait=True)
+    db_pool.close_all()
+    http_session.close()
 
 def main():
     """Simplified main function for Railway deployment"""
     safe_print("=== Starting Simplified Location Bot ===")
     
-    # Environment validation
-    TOKEN = os.getenv('DISCORD_TOKEN')
-    if not TOKEN:
+    # Environment validation - exit non-zero so the platform reports the bad config
+    if not DISCORD_TOKEN:
         safe_print("❌ DISCORD_TOKEN environment variable not found!")
-        return
+        log_listener.stop()
+        sys.exit(1)
     
-    GOOGLE_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
-    if not GOOGLE_API_KEY:
+    if not GOOGLE_MAPS_API_KEY:
         safe_print("⚠️ GOOGLE_MAPS_API_KEY not found - store search will be limited")
     else:
         safe_print("✅ Google Maps API key found")
@@ -3103,23 +3878,38 @@ def main():
     def start_bot():
         safe_print("🤖 Starting simplified Discord bot...")
         try:
-            bot.run(TOKEN, log_handler=None)  # Use our custom logging
+            bot.run(DISCORD_TOKEN, log_handler=None)  # Use our custom logging
         except Exception as e:
             handle_error(e, "Bot runtime")
     
     # Start Flask server immediately in a separate thread
+    flask_failed = threading.Event()
+    
     def start_flask():
         safe_print("🌐 Starting Flask server immediately...")
         try:
             run_enhanced_flask()
         except Exception as e:
+            # Port in use, bad socket path, ... - without HTTP the process is
+            # useless, so stop and let the platform restart the container
             handle_error(e, "Flask server error")
+            flask_failed.set()
+            shutdown_event.set()
+    
+    # Railway sends SIGTERM on redeploy; Ctrl+C sends SIGINT
+    for stop_signal in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(stop_signal, lambda signum, frame: shutdown_event.set())
     
     flask_thread = threading.Thread(target=start_flask, daemon=True)
     flask_thread.start()
     
     # Give Flask a moment to start
     time.sleep(2)
+    if flask_failed.is_set():
+        safe_print("❌ Flask server failed to start - exiting")
+        shutdown_services()
+        log_listener.stop()
+        sys.exit(1)
     safe_print("✅ Flask server started!")
     
     # Start bot in separate thread
@@ -3130,27 +3920,31 @@ def main():
     safe_print("⏰ Waiting for Discord bot to connect...")
     max_wait = 60  # Reduced from 90 to 60 seconds
     waited = 0
-    while not bot_connected and waited < max_wait:
-        time.sleep(1)
-        waited += 1
-        if waited % 10 == 0:  # Log every 10 seconds instead of 15
-            safe_print(f"⏰ Still waiting... ({waited}s)")
-    
-    if bot_connected:
+    # Wake as soon as on_ready fires; the 10s slices only pace the progress log
+    while not bot_connected_event.wait(timeout=10):
+        waited += 10
+        if waited >= max_wait or shutdown_event.is_set():
+            break
+        safe_print(f"⏰ Still waiting... ({waited}s)")
+    
+    if bot_connected_event.is_set():
         safe_print("✅ Discord bot connected!")
     else:
         safe_print("⚠️ Bot not ready yet, but Flask is running...")
     
-    # Keep the main thread alive
-    try:
-        heartbeat_count = 0
-        while True:
-            time.sleep(300)  # Sleep for 5 minutes instead of 1 minute
-            heartbeat_count += 1
-            if heartbeat_count % 12 == 0:  # Only log every hour (12 * 5 minutes = 60 minutes)
-                safe_print("💓 Bot heartbeat... (hourly)")
-    except KeyboardInterrupt:
-        safe_print("🛑 Shutting down...")
+    # Keep the main thread alive until a stop signal arrives
+    heartbeat_count = 0
+    while not shutdown_event.wait(timeout=300):  # Wake every 5 minutes
+        heartbeat_count += 1
+        if heartbeat_count % 12 == 0:  # Only log every hour (12 * 5 minutes = 60 minutes)
+            safe_print("💓 Bot heartbeat... (hourly)")
+    
+    safe_print("🛑 Shutting down...")
+    shutdown_services()
+    safe_print("✅ Shutdown complete")
+    log_listener.stop()  # Flushes queued log records
+    if flask_failed.is_set():
+        sys.exit(1)
 
 @app.route('/test', methods=['GET'])
 def test_endpoint():
@@ -3159,7 +3953,7 @@ def test_endpoint():
         status = {
             "bot_connected": bot_connected,
             "bot_ready": bot_ready,
-            "google_maps_available": gmaps is not None,
+            "google_maps_available": maps_available(),
             "location_channel_id": LOCATION_CHANNEL_ID,
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
@@ -3193,7 +3987,7 @@ def debug_endpoint():
             "port": port,
             "bot_connected": bot_connected,
             "bot_ready": bot_ready,
-            "google_maps_available": gmaps is not None,
+            "google_maps_available": maps_available(),
             "location_channel_id": LOCATION_CHANNEL_ID,
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
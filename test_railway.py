@@ -118,7 +118,7 @@ def test_webhook():
         
         print(f"Webhook response: {response.status_code}")
         
-        if response.status_code == 200:
+        if response.status_code in (200, 202):
             print("✅ Webhook test successful")
         else:
             print(f"❌ Webhook failed: {response.text}")